@@ -1,4 +1,5 @@
 from .source import Source
+from .supervisor import Supervisor
 from . import extra
 
 __version__ = '0.0.20'
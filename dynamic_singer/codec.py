@@ -0,0 +1,68 @@
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def default(obj):
+    if isinstance(obj, (date, datetime)):
+        return str(obj)
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(
+        f'Object of type {type(obj).__name__} is not JSON serializable'
+    )
+
+
+if orjson is not None:
+    backend = 'orjson'
+    _option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj, sort_keys = False):
+        """
+        Serialize `obj` to JSON bytes, date / datetime become str and Decimal become float, same as `helper.Encoder`.
+        """
+        option = _option | orjson.OPT_SORT_KEYS if sort_keys else _option
+        return orjson.dumps(obj, default = default, option = option)
+
+    loads = orjson.loads
+
+elif ujson is not None:
+    backend = 'ujson'
+
+    def dumps(obj, sort_keys = False):
+        """
+        Serialize `obj` to JSON bytes, date / datetime become str and Decimal become float, same as `helper.Encoder`.
+        """
+        return ujson.dumps(
+            obj, default = default, sort_keys = sort_keys, ensure_ascii = False
+        ).encode()
+
+    loads = ujson.loads
+
+else:
+    backend = 'json'
+
+    def dumps(obj, sort_keys = False):
+        """
+        Serialize `obj` to JSON bytes, date / datetime become str and Decimal become float, same as `helper.Encoder`.
+        """
+        return json.dumps(obj, default = default, sort_keys = sort_keys).encode()
+
+    loads = json.loads
+
+
+def format_message(message):
+    """
+    Serialize a singer message to JSON bytes.
+    """
+    return dumps(message.asdict())
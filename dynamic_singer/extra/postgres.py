@@ -1,9 +1,18 @@
 import pandas as pd
-from dynamic_singer.helper import Encoder
+from dynamic_singer import codec, metrics
+from psycopg2 import sql
+from psycopg2.extensions import encodings
 from psycopg2.extras import RealDictCursor
 from herpetologist import check_type
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import threading
+import queue
+import os
+import re
+import select
 import time
-import json
+import uuid
 import logging
 
 logger = logging.getLogger(__name__)
@@ -73,6 +82,169 @@ def bigquery_schema(schema: str, table: str, connection):
     return schema
 
 
+_converters = {
+    'date': str,
+    'timestamp': str,
+    'timestamptz': str,
+    'time': str,
+    'timetz': str,
+    'interval': str,
+    'numeric': float,
+}
+
+
+# parse values from COPY text format, other types except strings are parsed by psycopg2 typecasters.
+_text_parsers = {
+    'int2': int,
+    'int4': int,
+    'int8': int,
+    'oid': int,
+    'float4': float,
+    'float8': float,
+    'numeric': float,
+    'bool': lambda v: v == 't',
+    'json': codec.loads,
+    'jsonb': codec.loads,
+}
+
+_text_strings = {'text', 'varchar', 'bpchar', 'char', 'name'}
+
+_text_escape = re.compile(r'\\(.)')
+_text_escapes = {
+    'b': '\b',
+    'f': '\f',
+    'n': '\n',
+    'r': '\r',
+    't': '\t',
+    'v': '\v',
+}
+
+
+def _unescape(value):
+    return _text_escape.sub(
+        lambda m: _text_escapes.get(m.group(1), m.group(1)), value
+    )
+
+
+def _cast(cursor, oid, converter = None):
+    def cast(value):
+        value = cursor.cast(oid, value)
+        if converter is not None and value is not None:
+            value = converter(value)
+        return value
+
+    return cast
+
+
+def _array(converter):
+    def convert(values):
+        return [
+            (
+                convert(v)
+                if isinstance(v, list)
+                else (converter(v) if v is not None else None)
+            )
+            for v in values
+        ]
+
+    return convert
+
+
+class Row_Converter:
+    def __init__(self, schema: str, table: str, connection):
+        """
+        Convert postgres values into JSON values, date / datetime / time become str and Decimal become float, only for columns need it. Columns are taken from information_schema once.
+
+        Parameters
+        ----------
+        schema: str
+            postgres schema.
+        table: str
+            table name.
+        connection: object
+            psycopg2 connection object.
+        """
+        cursor = connection.cursor()
+        cursor.execute(
+            """
+            SELECT column_name, udt_name,
+            (quote_ident(udt_schema) || '.' || quote_ident(udt_name))::regtype::oid
+            FROM information_schema.COLUMNS
+            WHERE table_name = %s and table_schema = %s
+            ORDER BY ordinal_position
+            """,
+            (table, schema),
+        )
+        rows = cursor.fetchall()
+        self.columns = [(column, udt_name) for column, udt_name, _ in rows]
+        self.oids = {column: oid for column, _, oid in rows}
+        self.converters = {}
+        for column, udt_name in self.columns:
+            if udt_name.startswith('_') and udt_name[1:] in _converters:
+                self.converters[column] = _array(_converters[udt_name[1:]])
+            elif udt_name in _converters:
+                self.converters[column] = _converters[udt_name]
+        cursor.close()
+
+    def dicts(self, rows):
+        """
+        Convert dict rows in place.
+        """
+        converters = list(self.converters.items())
+        for row in rows:
+            for column, converter in converters:
+                v = row[column]
+                if v is not None:
+                    row[column] = converter(v)
+        return rows
+
+    def tuples(self, rows, description):
+        """
+        Convert tuple rows into dict rows.
+        """
+        columns = [d[0] for d in description]
+        positions = [
+            (i, self.converters[c])
+            for i, c in enumerate(columns)
+            if c in self.converters
+        ]
+        results = []
+        for row in rows:
+            if len(positions):
+                row = list(row)
+                for i, converter in positions:
+                    v = row[i]
+                    if v is not None:
+                        row[i] = converter(v)
+            results.append(dict(zip(columns, row)))
+        return results
+
+    def texts(self, lines, cursor):
+        """
+        Parse lines from `COPY ... TO STDOUT` text format into dict rows, values are the same as `dicts`. `cursor` is only used for `cursor.cast`.
+        """
+        parsers = []
+        for column, udt_name in self.columns:
+            parser = _text_parsers.get(udt_name)
+            if parser is None and udt_name not in _text_strings:
+                parser = _cast(
+                    cursor, self.oids[column], self.converters.get(column)
+                )
+            parsers.append((column, parser))
+        for line in lines:
+            row = {}
+            for (column, parser), v in zip(
+                parsers, line.rstrip('\n').split('\t')
+            ):
+                if v == '\\N':
+                    row[column] = None
+                    continue
+                if '\\' in v:
+                    v = _unescape(v)
+                row[column] = parser(v) if parser is not None else v
+            yield row
+
+
 class Tap:
     @check_type
     def __init__(
@@ -86,6 +258,20 @@ class Tap:
         rest_time: int = 10,
         filter: str = '',
         debug: bool = True,
+        streaming: bool = False,
+        itersize: int = 10000,
+        tuple_cursor: bool = False,
+        copy: bool = False,
+        prefetch: bool = False,
+        adaptive: bool = False,
+        max_batch_size: int = 10000,
+        max_batch_bytes: int = 10485760,
+        max_query_time: int = 1,
+        max_rest_time: int = 300,
+        pipeline: str = None,
+        listen: str = None,
+        shards: int = 0,
+        shards_persistent = None,
     ):
 
         """
@@ -100,7 +286,7 @@ class Tap:
         primary_key: str
             column acted as primary key.
         connection: object
-            psycopg2 connection object.
+            psycopg2 connection object, or a pool with `getconn` and `putconn` methods, a connection will be borrowed for each pull.
         persistent: object
             a python object that must has `pull` and `push` method to persist primary_key state.
         batch_size: int, (default=100)
@@ -111,11 +297,64 @@ class Tap:
             sql where statement for additional filter. Example, 'price > 0 and discount > 10', depends on table definition.
         debug: bool, (default=True)
             if true, will print important information.
+        streaming: bool, (default=False)
+            If True, stream rows using a server-side named cursor with a single query, instead of a query for every `batch_size` rows. Will rest only after all rows pulled.
+        itersize: int, (default=10000)
+            size of rows fetched from the server-side cursor for each network round trip, only if `streaming` is True.
+        tuple_cursor: bool, (default=False)
+            If True, fetch rows as tuples instead of `RealDictCursor` dicts, less allocation for wide tables.
+        copy: bool = False,
+            If True, stream rows using `COPY (SELECT ...) TO STDOUT`, much faster for full table and backfill loads. Will rest only after all rows pulled. Values are the same as other modes.
+        prefetch: bool = False,
+            If True, fetch the next batch in a background thread while the current batch is emitted. `persistent.push` only receives primary key of emitted rows.
+        adaptive: bool = False,
+            If True, double the batch size while query time and batch bytes are within budget, halve it if not, pull again without rest if a batch is full, and rest exponentially longer while batches are empty.
+        max_batch_size: int, (default=10000)
+            maximum batch size if `adaptive` is True.
+        max_batch_bytes: int, (default=10485760)
+            maximum estimated bytes of a batch if `adaptive` is True.
+        max_query_time: int, (default=1)
+            maximum seconds of a query if `adaptive` is True.
+        max_rest_time: int, (default=300)
+            maximum rest seconds for empty batches if `adaptive` is True.
+        pipeline: str, (default=None)
+            `pipeline` label for batch size, lag and query time metrics, should be the same as `tap_name` of `dynamic_singer.Source`. If None, will use `table`.
+        listen: str, (default=None)
+            If not None, `LISTEN` to `listen` channel and wake up as soon as a `NOTIFY` received instead of sleep for the whole rest time. The tap will commit `connection` before waiting, use a dedicated connection.
+        shards: int, (default=0)
+            If bigger than 0, backfill the table by splitting the primary key range into `shards` ranges and pull them concurrently, each range using a connection from `connection` pool. After all ranges pulled, continue as usual from the biggest primary key.
+        shards_persistent: object, (default=None)
+            python object that has `pull` and `push` method to persist state of the ranges as JSON, `pull` must return what has been pushed. Required if `shards` bigger than 0, must not share the same storage with `persistent`.
 
         """
 
         if not hasattr(persistent, 'pull') and not hasattr(persistent, 'push'):
             raise ValueError('persistent must has `pull` and `push` method')
+        if batch_size < 1:
+            raise ValueError('`batch_size` must bigger than 0')
+        if itersize < 1:
+            raise ValueError('`itersize` must bigger than 0')
+        if adaptive and max_batch_size < batch_size:
+            raise ValueError('`max_batch_size` must bigger than `batch_size`')
+        if max_query_time < 1:
+            raise ValueError('`max_query_time` must bigger than 0')
+        if shards < 0:
+            raise ValueError('`shards` must bigger than -1')
+        if shards > 0 and not hasattr(connection, 'getconn'):
+            raise ValueError('`shards` required `connection` to be a pool')
+        if shards > 0 and (
+            not hasattr(shards_persistent, 'pull')
+            or not hasattr(shards_persistent, 'push')
+        ):
+            raise ValueError(
+                '`shards` required `shards_persistent` that has `pull` and `push` method'
+            )
+        if hasattr(connection, 'getconn') and (
+            streaming or copy or prefetch or listen is not None
+        ):
+            raise ValueError(
+                '`streaming`, `copy`, `prefetch` and `listen` required a dedicated connection, not a pool'
+            )
 
         self.schema = schema
         self.table = table
@@ -125,52 +364,485 @@ class Tap:
         self.rest_time = rest_time
         self.i = 0
         self.index = None
+        self.checkpoint = None
         self.batch = []
-        self.cursor = connection.cursor(cursor_factory = RealDictCursor)
+        self.tuple_cursor = tuple_cursor
+        self.cursor_factory = None if tuple_cursor else RealDictCursor
+        if hasattr(connection, 'getconn'):
+            self._pool = connection
+            self.connection = None
+            self.cursor = None
+        else:
+            self._pool = None
+            self.connection = connection
+            self.cursor = connection.cursor(
+                cursor_factory = self.cursor_factory
+            )
+        self.converter = None
         self.first_time = True
         self.filter = filter
         self.debug = debug
+        self.streaming = streaming
+        self.copy = copy
+        self.prefetch = prefetch
+        self._prefetch = None
+        self._executor = None
+        self.adaptive = adaptive
+        self.min_batch_size = batch_size
+        self.max_batch_size = max_batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.max_query_time = max_query_time
+        self.max_rest_time = max_rest_time
+        self._empty = 0
+        self._caught_up = time.time()
+        self.listen = listen
+        self._listening = False
+        self.shards = shards
+        self.shards_persistent = shards_persistent
+        self._shards = None
+        self._backfill = None
+        self._metrics = metrics.get(pipeline or table)
+        self._metrics.gauges['tap_batch_size'] = batch_size
+        self._metrics.gauges['tap_lag'] = 0
+        self.itersize = itersize
         self.count = 0
+        self._stream = None
+        self._exhausted = False
+
+    def _query(self, limit = True, lower = None, upper = None):
+        query = sql.SQL('select * from {}.{}').format(
+            sql.Identifier(self.schema), sql.SQL(self.table)
+        )
+        where, params = [], []
+        if lower is None:
+            lower = self.index
+        if lower is not None and lower != '':
+            where.append(
+                sql.SQL('{} > %s').format(sql.SQL(self.primary_key))
+            )
+            params.append(lower)
+        if upper is not None:
+            where.append(
+                sql.SQL('{} <= %s').format(sql.SQL(self.primary_key))
+            )
+            params.append(upper)
+        if len(self.filter):
+            filter = sql.SQL(self.filter.replace('%', '%%'))
+            where.append(sql.SQL('({})').format(filter))
+        if len(where):
+            query += sql.SQL(' where ') + sql.SQL(' and ').join(where)
+        query += sql.SQL(' order by {}').format(sql.SQL(self.primary_key))
+        if limit:
+            query += sql.SQL(' limit %s')
+            params.append(self.batch_size)
+        return query, params
+
+    def _open_stream(self):
+        query, params = self._query(limit = False)
+        if self.debug:
+            logger.info(self.cursor.mogrify(query, params).decode())
+
+        cursor = self.connection.cursor(
+            name = f'dynamic_singer_{uuid.uuid4().hex}',
+            cursor_factory = self.cursor_factory,
+            withhold = self.connection.autocommit,
+        )
+        cursor.itersize = self.itersize
+        cursor.execute(query, params)
+        return cursor
+
+    def _open_copy(self):
+        query, params = self._query(limit = False)
+        query = sql.SQL('COPY ({}) TO STDOUT').format(query)
+        query = self.cursor.mogrify(query, params).decode()
+        if self.debug:
+            logger.info(query)
+
+        r, w = os.pipe()
+        error = []
+
+        def copy():
+            try:
+                with os.fdopen(w, 'wb') as fopen:
+                    self.cursor.copy_expert(query, fopen)
+            except Exception as e:
+                error.append(e)
+
+        t = threading.Thread(target = copy, daemon = True)
+        t.start()
+        encoding = encodings.get(self.connection.encoding, 'utf-8')
+        cursor = self.connection.cursor()
+        with os.fdopen(r, 'r', encoding = encoding, newline = '\n') as fopen:
+            yield from self.converter.texts(fopen, cursor)
+        t.join()
+        if len(error):
+            raise error[0]
+
+    def _wait(self, seconds):
+        if self.listen is None:
+            time.sleep(seconds)
+            return
+
+        if not self.connection.autocommit:
+            self.connection.commit()
+        self.connection.poll()
+        if not len(self.connection.notifies):
+            select.select([self.connection], [], [], seconds)
+            self.connection.poll()
+        if len(self.connection.notifies):
+            if self.debug:
+                logger.info(
+                    f'received {len(self.connection.notifies)} notifications from {self.listen}'
+                )
+            del self.connection.notifies[:]
+
+    def _fetch(self):
+        before = time.perf_counter()
+        if self.copy:
+            if self._stream is None:
+                self._stream = self._open_copy()
+            batch = list(itertools.islice(self._stream, self.batch_size))
+            exhausted = len(batch) < self.batch_size
+            if exhausted:
+                self._stream = None
+        else:
+            if self.streaming:
+                if self._stream is None:
+                    self._stream = self._open_stream()
+                cursor = self._stream
+                r = list(itertools.islice(cursor, self.batch_size))
+                exhausted = len(r) < self.batch_size
+                if exhausted:
+                    self._stream = None
+            else:
+                query, params = self._query()
+                if self.debug:
+                    logger.info(self.cursor.mogrify(query, params).decode())
+
+                cursor = self.cursor
+                cursor.execute(query, params)
+                r = cursor.fetchall()
+                exhausted = len(r) < self.batch_size
+
+            if self.tuple_cursor:
+                batch = self.converter.tuples(r, cursor.description)
+            else:
+                batch = self.converter.dicts(r)
+            if cursor is not self.cursor and exhausted:
+                cursor.close()
+
+        if len(batch):
+            self.index = batch[-1][self.primary_key]
+        return batch, exhausted, time.perf_counter() - before
+
+    def _adapt(self, seconds):
+        self._metrics.observe('query', seconds)
+        now = time.time()
+        if self._exhausted:
+            self._caught_up = now
+        self._metrics.gauges['tap_lag'] = now - self._caught_up
+
+        if len(self.batch):
+            self._empty = 0
+        else:
+            self._empty += 1
+
+        if not self.adaptive or not len(self.batch):
+            return
+        size = len(codec.dumps(self.batch[-1])) * len(self.batch)
+        if seconds > self.max_query_time or size > self.max_batch_bytes:
+            self.batch_size = max(self.batch_size // 2, self.min_batch_size)
+        elif (
+            not self._exhausted
+            and seconds * 2 <= self.max_query_time
+            and size * 2 <= self.max_batch_bytes
+        ):
+            self.batch_size = min(self.batch_size * 2, self.max_batch_size)
+        self._metrics.gauges['tap_batch_size'] = self.batch_size
+
+    def _rest(self):
+        if self._backfill is not None:
+            return 0
+        if not self.adaptive:
+            if not (self.streaming or self.copy) or self._exhausted:
+                return self.rest_time
+            return 0
+        if not self._exhausted:
+            return 0
+        if len(self.batch):
+            return self.rest_time
+        return min(self.rest_time * 2 ** (self._empty - 1), self.max_rest_time)
+
+    def _ranges(self):
+        table = sql.SQL('{}.{}').format(
+            sql.Identifier(self.schema), sql.SQL(self.table)
+        )
+        primary_key = sql.SQL(self.primary_key)
+
+        # a query without parameters is not formatted, `%` must not be escaped.
+        where = sql.SQL('')
+        if len(self.filter):
+            where = sql.SQL(' where ({})').format(sql.SQL(self.filter))
+        self.cursor.execute(
+            sql.SQL('select min({}), max({}) from {}{}').format(
+                primary_key, primary_key, table, where
+            )
+        )
+        r = self.cursor.fetchone()
+        if isinstance(r, dict):
+            r = list(r.values())
+        minimum, maximum = r
+        if maximum is None:
+            return []
+
+        if isinstance(minimum, (int, float)) and not isinstance(
+            minimum, bool
+        ):
+            step = (maximum - minimum) / self.shards
+            bounds = [minimum + step * i for i in range(1, self.shards)]
+            if isinstance(minimum, int):
+                bounds = [int(b) for b in bounds]
+        else:
+            percentiles = [i / self.shards for i in range(1, self.shards)]
+            if len(self.filter):
+                filter = sql.SQL(self.filter.replace('%', '%%'))
+                where = sql.SQL(' where ({})').format(filter)
+            bounds = None
+            for sample in (
+                sql.SQL(' tablesample system (1)'),
+                sql.SQL(''),
+            ):
+                self.cursor.execute(
+                    sql.SQL(
+                        'select percentile_disc(%s) within group (order by {}) from {}{}{}'
+                    ).format(primary_key, table, sample, where),
+                    (percentiles,),
+                )
+                r = self.cursor.fetchone()
+                if isinstance(r, dict):
+                    r = list(r.values())
+                if r[0] is not None and None not in r[0]:
+                    bounds = r[0]
+                    break
+            if bounds is None:
+                bounds = []
+
+        converter = self.converter.converters.get(self.primary_key)
+        if converter is not None:
+            bounds = [converter(b) for b in bounds]
+            maximum = converter(maximum)
+        bounds = sorted(set(b for b in bounds if b < maximum))
+        lowers = [None] + bounds
+        uppers = bounds + [maximum]
+        return [[l, u, None, False] for l, u in zip(lowers, uppers)]
+
+    def _read_shard(self, index, lower, upper):
+        connection = None
+        try:
+            connection = self._pool.getconn()
+            cursor = connection.cursor(cursor_factory = self.cursor_factory)
+            while True:
+                query, params = self._query(lower = lower, upper = upper)
+                cursor.execute(query, params)
+                r = cursor.fetchall()
+                if self.tuple_cursor:
+                    batch = self.converter.tuples(r, cursor.description)
+                else:
+                    batch = self.converter.dicts(r)
+                if len(batch):
+                    self._backfill.put((index, batch))
+                    lower = batch[-1][self.primary_key]
+                if len(batch) < self.batch_size:
+                    break
+            cursor.close()
+            self._backfill.put((index, None))
+        except Exception as e:
+            self._backfill.put((index, e))
+        finally:
+            if connection is not None:
+                self._pool.putconn(connection)
+
+    def _start_backfill(self):
+        self._backfill = queue.Queue(maxsize = self.shards * 2)
+        self._running = 0
+        for index, (lower, upper, checkpoint, done) in enumerate(
+            self._shards
+        ):
+            if done:
+                continue
+            if checkpoint is not None:
+                lower = checkpoint
+            threading.Thread(
+                target = self._read_shard,
+                args = (index, lower, upper),
+                daemon = True,
+            ).start()
+            self._running += 1
+        if not self._running:
+            self._finish_backfill()
+
+    def _finish_backfill(self):
+        self._backfill = None
+        for shard in self._shards:
+            shard[3] = True
+        self.index = self._shards[-1][1]
+        self.checkpoint = self.index
+        self.persistent.push(self.checkpoint)
+        self._push_shards()
+        if self.debug:
+            logger.info(
+                f'backfill done for {self.schema}.{self.table}, continue from primary key {self.index}'
+            )
+
+    def _pull_shard(self):
+        while self._backfill is not None:
+            index, batch = self._backfill.get()
+            if isinstance(batch, Exception):
+                raise batch
+            if batch is None:
+                self._shards[index][3] = True
+                self._running -= 1
+                if not self._running:
+                    self._finish_backfill()
+                continue
+            self._shards[index][2] = batch[-1][self.primary_key]
+            self.batch, self._exhausted = batch, False
+            if self.debug:
+                logger.info(f'current shards: {self._shards}')
+            return True
+        return False
+
+    def _push_shards(self):
+        self.shards_persistent.push(
+            codec.dumps({'shards': self._shards}).decode()
+        )
+
+    def _push(self):
+        if self._backfill is not None:
+            self._push_shards()
+        else:
+            self.persistent.push(self.checkpoint)
+
+    def _load_shards(self):
+        try:
+            state = self.shards_persistent.pull()
+        except:
+            state = None
+        if isinstance(state, bytes):
+            state = state.decode()
+        if isinstance(state, str) and state.startswith('{'):
+            state = codec.loads(state)
+        if isinstance(state, dict) and 'shards' in state:
+            if all(shard[3] for shard in state['shards']):
+                return []
+            return state['shards']
+
+        try:
+            index = self.persistent.pull()
+        except:
+            index = None
+        if index is not None and index != '':
+            self.index = index
+            self.checkpoint = index
+            return []
+
+        shards = self._ranges()
+        if len(shards):
+            self._shards = shards
+            self._push_shards()
+        return shards
+
+    def _prepare_shards(self):
+        if self.converter is None:
+            self.converter = Row_Converter(
+                self.schema, self.table, self.connection
+            )
+        self._shards = self._load_shards()
+
+    def _borrow(self, function):
+        self.connection = self._pool.getconn()
+        try:
+            self.cursor = self.connection.cursor(
+                cursor_factory = self.cursor_factory
+            )
+            function()
+            self.cursor.close()
+        finally:
+            self._pool.putconn(self.connection)
+            self.connection, self.cursor = None, None
 
     def pull(self):
+        if self._pool is None:
+            return self._pull()
+
+        # shard threads start after the connection returned, so `shards` connections are enough.
+        if self.shards > 0 and self._shards is None:
+            self._borrow(self._prepare_shards)
+            if len(self._shards):
+                self._start_backfill()
+
+        # shard threads hold their own connections, do not borrow one while waiting for them.
+        if self._backfill is not None and self._pull_shard():
+            self.first_time = False
+            return
+
+        self._borrow(self._pull)
+
+    def _pull(self):
+        if self.converter is None:
+            self.converter = Row_Converter(
+                self.schema, self.table, self.connection
+            )
+
         if self.index is None:
             try:
                 self.index = self.persistent.pull()
+                self.checkpoint = self.index
             except:
                 pass
 
-        if self.index:
-            if len(self.filter):
-                where = f"where {self.primary_key} > '{self.index}' and {self.filter}"
-            else:
-                where = f"where {self.primary_key} > '{self.index}'"
+        if self.listen is not None and not self._listening:
+            self.cursor.execute(
+                sql.SQL('LISTEN {}').format(sql.Identifier(self.listen))
+            )
+            if not self.connection.autocommit:
+                self.connection.commit()
+            self._listening = True
+
+        if self._prefetch is not None:
+            self.batch, self._exhausted, seconds = self._prefetch.result()
+            self._prefetch = None
         else:
-            if len(self.filter):
-                where = f'where {self.filter}'
-            else:
-                where = ''
+            self.batch, self._exhausted, seconds = self._fetch()
+        self._adapt(seconds)
 
-        query = f'select * from "{self.schema}".{self.table} {where} order by {self.primary_key} limit {self.batch_size}'
-        if self.debug:
-            logger.info(query)
+        if self.prefetch and not self._exhausted:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers = 1)
+            self._prefetch = self._executor.submit(self._fetch)
 
-        self.cursor.execute(query)
-        r = self.cursor.fetchall()
-        self.batch = json.loads(json.dumps(r, cls = Encoder))
         if len(self.batch):
-            self.index = self.batch[-1][self.primary_key]
+            self.checkpoint = self.batch[-1][self.primary_key]
 
         if self.debug:
-            logger.info(f'current primary key: {self.index}')
+            logger.info(f'current primary key: {self.checkpoint}')
 
         self.first_time = False
 
+    def boundary(self):
+        """
+        Returns True if next `emit` will push the checkpoint and pull a new batch, all emitted rows must be processed before that.
+        """
+        return self.i == len(self.batch)
+
     def emit(self):
         while self.i == len(self.batch):
             if not self.first_time:
                 if self.count == len(self.batch):
-                    time.sleep(self.rest_time)
-                    self.persistent.push(self.index)
+                    rest = self._rest()
+                    if rest > 0:
+                        self._wait(rest)
+                    self._push()
                 else:
                     raise Exception(
                         'size of rows processed not same as rows emitted.'
@@ -181,3 +853,223 @@ class Tap:
 
         self.i += 1
         return self.batch[self.i - 1]
+
+
+class Scheduler:
+    def __init__(self, pool, max_connections: int = 4):
+        """
+        Borrow connections from `pool` for multiple taps, at most `max_connections` at the same time. If taps are waiting, highest priority goes first, then longest lag.
+
+        Parameters
+        ----------
+        pool: object
+            psycopg2 pool object, must has `getconn` and `putconn` methods.
+        max_connections: int, (default=4)
+            maximum connections borrowed at the same time.
+        """
+        if max_connections < 1:
+            raise ValueError('`max_connections` must bigger than 0')
+        self.pool = pool
+        self.max_connections = max_connections
+        self._available = max_connections
+        self._waiting = {}
+        self._condition = threading.Condition()
+
+    def _next(self):
+        return max(self._waiting, key = self._waiting.get)
+
+    def getconn(self, priority = 0, lag = 0):
+        # a table can wait from many threads, example, shards, so every call waits with its own token.
+        token = object()
+        with self._condition:
+            self._waiting[token] = (priority, lag)
+            self._condition.wait_for(
+                lambda: self._available > 0 and self._next() is token
+            )
+            del self._waiting[token]
+            self._available -= 1
+            self._condition.notify_all()
+        try:
+            return self.pool.getconn()
+        except Exception:
+            self._release()
+            raise
+
+    def putconn(self, connection):
+        try:
+            self.pool.putconn(connection)
+        finally:
+            self._release()
+
+    def _release(self):
+        with self._condition:
+            self._available += 1
+            self._condition.notify_all()
+
+
+class _Table_Pool:
+    def __init__(self, scheduler, table, priority):
+        self.scheduler = scheduler
+        self.table = table
+        self.priority = priority
+        self.tap = None
+
+    def getconn(self):
+        lag = self.tap._metrics.gauges.get('tap_lag', 0) if self.tap else 0
+        return self.scheduler.getconn(self.priority, lag)
+
+    def putconn(self, connection):
+        self.scheduler.putconn(connection)
+
+
+class Multi_Tap:
+    @check_type
+    def __init__(
+        self,
+        schema: str,
+        pool,
+        persistent,
+        tables: list = None,
+        primary_keys: dict = None,
+        priorities: dict = None,
+        max_connections: int = 4,
+        shards_persistent = None,
+        **kwargs,
+    ):
+        """
+        Postgres Tap for multiple tables in a schema, sharing a bounded connection pool. Each table is a `Tap` with its own stream and primary key state.
+
+        Parameters
+        ----------
+        schema: str
+            postgres schema.
+        pool: object
+            psycopg2 pool object, must has `getconn` and `putconn` methods, example, `psycopg2.pool.ThreadedConnectionPool`.
+        persistent: Callable
+            `persistent(table, primary_key)` must returned a python object that has `pull` and `push` method to persist primary_key state of the table.
+        tables: list, (default=None)
+            tables to pull. If None, will use all tables in `schema` that has a single column primary key.
+        primary_keys: dict, (default=None)
+            primary key for each table, if not provided, will use primary key constraint of the table.
+        priorities: dict, (default=None)
+            priority for each table, bigger pulls first if waiting for a connection, default is 0.
+        max_connections: int, (default=4)
+            maximum connections borrowed from `pool` at the same time.
+        shards_persistent: Callable, (default=None)
+            `shards_persistent(table, primary_key)` must returned a python object that has `pull` and `push` method to persist state of the ranges, required if `shards` bigger than 0.
+        **kwargs:
+            keyword arguments for `Tap`, example, `batch_size`, `rest_time`, `adaptive`.
+        """
+        if not hasattr(pool, 'getconn') or not hasattr(pool, 'putconn'):
+            raise ValueError('pool must has `getconn` and `putconn` method')
+        if not callable(persistent):
+            raise ValueError('persistent must a callable')
+        if shards_persistent is not None and not callable(shards_persistent):
+            raise ValueError('shards_persistent must a callable')
+
+        self.schema = schema
+        self.scheduler = Scheduler(pool, max_connections = max_connections)
+        primary_keys = primary_keys or {}
+        priorities = priorities or {}
+
+        connection = pool.getconn()
+        try:
+            discovered = self._discover(connection)
+        finally:
+            pool.putconn(connection)
+
+        if tables is None:
+            tables = sorted(discovered)
+        self.taps = []
+        for table in tables:
+            primary_key = primary_keys.get(table, discovered.get(table))
+            if primary_key is None:
+                logger.warning(
+                    f'{schema}.{table} does not have a single column primary key, skipped.'
+                )
+                continue
+            table_pool = _Table_Pool(
+                self.scheduler, table, priorities.get(table, 0)
+            )
+            tap = Tap(
+                schema,
+                table,
+                primary_key,
+                table_pool,
+                persistent(table, primary_key),
+                shards_persistent = shards_persistent(table, primary_key)
+                if shards_persistent
+                else None,
+                **kwargs,
+            )
+            table_pool.tap = tap
+            self.taps.append(tap)
+
+        if not len(self.taps):
+            raise ValueError(f'no table to pull from schema {schema}')
+
+    def _discover(self, connection):
+        cursor = connection.cursor()
+        cursor.execute(
+            """
+            SELECT t.table_name, k.column_name
+            FROM information_schema.tables t
+            LEFT JOIN information_schema.table_constraints c
+            ON c.table_schema = t.table_schema
+            AND c.table_name = t.table_name
+            AND c.constraint_type = 'PRIMARY KEY'
+            LEFT JOIN information_schema.key_column_usage k
+            ON k.constraint_schema = c.constraint_schema
+            AND k.constraint_name = c.constraint_name
+            WHERE t.table_schema = %s and t.table_type = 'BASE TABLE'
+            """,
+            (self.schema,),
+        )
+        columns = {}
+        for table, column in cursor.fetchall():
+            columns.setdefault(table, [])
+            if column is not None:
+                columns[table].append(column)
+        cursor.close()
+        return {
+            table: c[0] if len(c) == 1 else None for table, c in columns.items()
+        }
+
+    def get_taps(self):
+        """
+        Returns
+        ----------
+        result: list of `Tap`
+        """
+        return self.taps
+
+    def source(self, **kwargs):
+        """
+        Initiate a `dynamic_singer.Source` reading all tables concurrently, each table emits its own stream.
+
+        Parameters
+        ----------
+        **kwargs:
+            keyword arguments for `dynamic_singer.Source`, example, `port`, `pipeline`. `pipeline` default is `schema`.
+
+        Returns
+        -------
+        result : dynamic_singer.Source
+        """
+        from dynamic_singer.source import Source
+
+        kwargs.setdefault('pipeline', self.schema)
+        source = None
+        for tap in self.taps:
+            if source is None:
+                source = Source(
+                    tap,
+                    tap_name = tap.table,
+                    tap_key = tap.primary_key,
+                    **kwargs,
+                )
+            else:
+                source.add_tap(
+                    tap, tap_name = tap.table, tap_key = tap.primary_key
+                )
+        return source
@@ -1,8 +1,9 @@
 import re
 import os
-import fcntl
+import hashlib
 import time
 import logging
+from dynamic_singer import codec
 
 logger = logging.getLogger()
 
@@ -13,10 +14,65 @@ def parse_name(f):
     return f
 
 
+_header = re.compile(
+    r'\s*\{\s*"type"\s*:\s*"(\w+)"(?:\s*,\s*"stream"\s*:\s*"((?:[^"\\]|\\.)*)")?'
+)
+
+
+def classify(line):
+    """
+    Get type and stream of a singer message without decoding the whole message.
+
+    Parameters
+    ----------
+    line: str
+
+    Returns
+    -------
+    result : (str, str), stream is None if the message does not have a stream.
+    """
+    m = _header.match(line)
+    if m is not None:
+        message_type, stream = m.group(1), m.group(2)
+        if stream is not None:
+            if '\\' in stream:
+                stream = codec.loads(f'"{stream}"')
+            return message_type, stream
+        if message_type not in ('RECORD', 'SCHEMA', 'ACTIVATE_VERSION'):
+            return message_type, None
+    try:
+        message = codec.loads(line)
+    except ValueError:
+        return None, None
+    if not isinstance(message, dict):
+        return None, None
+    return message.get('type'), message.get('stream')
+
+
+def fingerprint(schema):
+    return hashlib.md5(codec.dumps(schema, sort_keys = True)).hexdigest()
+
+
 def log_subprocess_output(pipe, graceful_shutdown = 30, parse_error = True):
     error = '\n'.join(
         [line.decode().strip() for line in iter(pipe.readline, b'')]
     )
+    check_subprocess_error(error, graceful_shutdown, parse_error)
+
+
+async def alog_subprocess_output(
+    pipe, graceful_shutdown = 30, parse_error = True
+):
+    error = []
+    while True:
+        line = await pipe.readline()
+        if not len(line):
+            break
+        error.append(line.decode().strip())
+    check_subprocess_error('\n'.join(error), graceful_shutdown, parse_error)
+
+
+def check_subprocess_error(error, graceful_shutdown = 30, parse_error = True):
     if len(error):
         print(error)
         if (
@@ -36,12 +92,3 @@ def log_subprocess_output(pipe, graceful_shutdown = 30, parse_error = True):
             else:
                 raise Exception(error)
 
-
-def non_block_read(output):
-    fd = output.fileno()
-    fl = fcntl.fcntl(fd, fcntl.F_GETFL)
-    fcntl.fcntl(fd, fcntl.F_SETFL, fl | os.O_NONBLOCK)
-    try:
-        return output.readline()
-    except:
-        return ''
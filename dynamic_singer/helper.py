@@ -1,15 +1,17 @@
 import threading
+import queue
 import json
+import time
 from datetime import date, datetime
 from decimal import Decimal
-from dynamic_singer import function
+from dynamic_singer import function, codec, metrics
 from jsonschema import validate
 from genson import SchemaBuilder
-from singer.messages import SchemaMessage, RecordMessage, format_message
-from prometheus_client import Counter, Summary, Histogram
+from singer.messages import SchemaMessage, RecordMessage
 from herpetologist import check_type
 from typing import Callable
-import singer
+from collections import deque
+from subprocess import Popen
 import logging
 
 logger = logging.getLogger()
@@ -24,6 +26,84 @@ type_mapping = {
 }
 
 
+def _shape(value):
+    if isinstance(value, dict):
+        return tuple((k, _shape(value[k])) for k in sorted(value))
+    if isinstance(value, (list, tuple)):
+        return (list, frozenset(_shape(v) for v in value))
+    return type(value)
+
+
+class Infer_Schema:
+    def __init__(self, tap_schema = None, max_shapes: int = 10000):
+        """
+        Incremental schema inference for each stream, genson only called for unseen record shapes.
+
+        Parameters
+        ----------
+        tap_schema: Dict, (default=None)
+            If not None, properties from `tap_schema` will override inferred properties.
+        max_shapes: int, (default=10000)
+            maximum cached record shapes for each stream.
+        """
+        self.tap_schema = tap_schema
+        self.max_shapes = max_shapes
+        self._builders = {}
+        self._shapes = {}
+        self._fingerprints = {}
+
+    def add(self, stream, record, types = None):
+        """
+        Add a record into stream schema.
+
+        Returns
+        -------
+        result : dict, merged schema if schema changed, else None.
+        """
+        shape = _shape(record)
+        if types:
+            shape = (shape, tuple(sorted((k, str(v)) for k, v in types.items())))
+        shapes = self._shapes.setdefault(stream, set())
+        if shape in shapes:
+            return None
+        if len(shapes) >= self.max_shapes:
+            shapes.clear()
+        shapes.add(shape)
+
+        if stream not in self._builders:
+            builder = SchemaBuilder()
+            builder.add_schema({'type': 'object', 'properties': {}})
+            self._builders[stream] = builder
+        builder = self._builders[stream]
+        builder.add_object(record)
+        schema = builder.to_schema()
+
+        if self.tap_schema:
+            for k, v in self.tap_schema['properties'].items():
+                if k in schema['properties']:
+                    schema['properties'][k] = v
+        if types:
+            for k, v in types.items():
+                if k in schema['properties']:
+                    v = type_mapping.get(v, v)
+                    if not isinstance(v, str):
+                        raise ValueError(f'value {v} from {k} not supported.')
+                    schema['properties'][k] = {'type': v}
+
+        fingerprint = function.fingerprint(schema)
+        if fingerprint == self._fingerprints.get(stream):
+            return None
+        self._fingerprints[stream] = fingerprint
+        return schema
+
+    def forget(self, stream):
+        """
+        Forget the last returned schema of a stream, next record of the stream will return the schema again.
+        """
+        self._fingerprints.pop(stream, None)
+        self._shapes.pop(stream, None)
+
+
 class Tap:
     @check_type
     def __init__(self, tap, tap_schema, tap_name: str, tap_key: str):
@@ -35,65 +115,627 @@ class Tap:
         self.tap_schema = tap_schema
         self.tap_name = tap_name
         self.tap_key = tap_key
-
+        self._delivered = threading.Condition()
+        self.reset()
+
+    def reset(self):
+        """
+        Reset row count and schema state before a run, so new target processes receive the SCHEMA again.
+        """
+        self.tap.count = 0
+        self.pending = 0
+        self._fingerprint = None
         if not self.tap_schema:
-            self.builder = SchemaBuilder()
-            self.builder.add_schema({'type': 'object', 'properties': {}})
+            self.builder = Infer_Schema()
+
+    def boundary(self):
+        """
+        Check whether next `tap.emit()` will checkpoint rows emitted before, from optional `tap.boundary()`.
+        """
+        boundary = getattr(self.tap, 'boundary', None)
+        return boundary is not None and boundary()
+
+    def deliver(self, rows):
+        """
+        Count rows already sent to the targets into `tap.count`.
+        """
+        with self._delivered:
+            self.tap.count += rows
+            self.pending -= rows
+            self._delivered.notify_all()
+
+    def wait(self):
+        """
+        Block until all emitted rows sent to the targets.
+        """
+        with self._delivered:
+            self._delivered.wait_for(lambda: not self.pending)
 
     def __iter__(self):
         return self
 
     def __next__(self):
+        if self.pending and self.boundary():
+            return []
         row = self.tap.emit()
-        if row:
-            if not isinstance(row, dict):
-                raise ValueError('tap.emit() must returned a dict')
-            if self.tap_key not in row:
-                raise ValueError('tap key not exist in elements from tap')
-
-            if not self.tap_schema:
-                self.builder.add_object(row)
-                schema = self.builder.to_schema()
-            else:
-                schema = self.tap_schema
+        if not row:
+            return None
+        with self._delivered:
+            self.pending += 1
+        if not isinstance(row, dict):
+            raise ValueError('tap.emit() must returned a dict')
+        if self.tap_key not in row:
+            raise ValueError('tap key not exist in elements from tap')
+
+        if not self.tap_schema:
+            schema = self.builder.add(self.tap_name, row)
+        elif self._fingerprint is None:
+            schema = self.tap_schema
+            self._fingerprint = function.fingerprint(schema)
+        else:
+            schema = None
+
+        if isinstance(self.tap_key, (str, bytes)):
+            key_properties = [self.tap_key]
+        if not isinstance(key_properties, list):
+            raise Exception('tap key must be a string or list of strings')
 
-            if isinstance(self.tap_key, (str, bytes)):
-                key_properties = [self.tap_key]
-            if not isinstance(key_properties, list):
-                raise Exception('tap key must be a string or list of strings')
+        r = RecordMessage(
+            stream = self.tap_name, record = row, time_extracted = None
+        )
+        r = codec.format_message(r)
 
-            r = SchemaMessage(
+        if schema is not None:
+            s = SchemaMessage(
                 stream = self.tap_name,
                 schema = schema,
                 key_properties = key_properties,
                 bookmark_properties = None,
             )
-            s = format_message(r)
-            r = RecordMessage(
-                stream = self.tap_name, record = row, time_extracted = None
-            )
-            r = format_message(r)
-            row = (s.encode(), r.encode())
+            s = codec.format_message(s)
+            row = (s, r)
+        else:
+            row = (r,)
         return row
 
 
+class Fan_In:
+    def __init__(self, taps, queue_size: int = 1000, timeout = None):
+        """
+        Read multiple taps concurrently, each tap in a separate thread, and interleave their messages.
+
+        Parameters
+        ----------
+        taps: list of (tap, reader)
+            reader is a `subprocess.Popen` or a `Tap`, `tap` returned together with the messages. A `Tap` reader waits until its rows sent to the targets before crossing a batch boundary.
+        queue_size: int, (default=1000)
+            maximum messages waiting, reader threads will block if the queue is full.
+        timeout: int, (default=None)
+            If not None, return (None, []) after no message received for `timeout` seconds.
+        """
+        self.queue = queue.Queue(maxsize = queue_size)
+        self.timeout = timeout
+        self._remaining = len(taps)
+        self._threads = [
+            threading.Thread(target = self._read, args = tap, daemon = True)
+            for tap in taps
+        ]
+        for t in self._threads:
+            t.start()
+
+    def _read(self, tap, reader):
+        try:
+            if isinstance(reader, Popen):
+                with reader.stdout:
+                    for line in iter(reader.stdout.readline, b''):
+                        self.queue.put((tap, line))
+                reader.wait()
+            else:
+                while True:
+                    lines = next(reader)
+                    if lines is None:
+                        break
+                    self.queue.put((tap, lines))
+                    if not len(lines):
+                        reader.wait()
+            self.queue.put((tap, None))
+        except Exception as e:
+            self.queue.put((tap, e))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while self._remaining:
+            try:
+                tap, lines = self.queue.get(timeout = self.timeout)
+            except queue.Empty:
+                return None, []
+            if isinstance(lines, Exception):
+                raise lines
+            if lines is not None:
+                return tap, lines
+            self._remaining -= 1
+        raise StopIteration
+
+
+class Sampled_Log:
+    def __init__(self, sample: int = 1, rate: int = 0):
+        """
+        Log lines per key, a key is a stream or a target name.
+
+        Parameters
+        ----------
+        sample: int, (default=1)
+            log 1 in every `sample` lines for each key.
+        rate: int, (default=0)
+            If bigger than 0, log at most `rate` lines per second for each key.
+        """
+        self.sample = sample
+        self.rate = rate
+        self.skipped = 0
+        self._counts = {}
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def log(self, key, line):
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+            if count % self.sample:
+                self.skipped += 1
+                return
+            if self.rate > 0:
+                now = int(time.time())
+                window, logged = self._windows.get(key, (now, 0))
+                if window != now:
+                    window, logged = now, 0
+                if logged >= self.rate:
+                    self.skipped += 1
+                    return
+                self._windows[key] = (window, logged + 1)
+        logger.info(line)
+
+
 class Target:
-    def __init__(self, target, target_str):
+    def __init__(
+        self,
+        target,
+        target_str,
+        pipeline: str = '',
+        buffer_rows: int = 1,
+        buffer_bytes: int = 0,
+        buffer_time: int = 0,
+        output_size: int = 1000,
+        streams = None,
+    ):
         self.target = target
+        self.streams = streams
+        self.outputs = deque(maxlen = output_size)
+        self.state = None
+        self.buffer_rows = buffer_rows
+        self.buffer_bytes = buffer_bytes
+        self.buffer_time = buffer_time
+        self._buffer = []
+        self._buffer_size = 0
+        self._buffer_start = None
+        self.lock = threading.Lock()
         if isinstance(target_str, str):
             f = target_str
         else:
             f = target_str.__class__.__name__
 
-        f = function.parse_name(f)
+        self.name = f
+        self._metrics = metrics.get(pipeline, f)
+
+    def accept(self, stream):
+        """
+        Check whether the target consumes `stream`, a message without stream goes to all targets.
+        """
+        if stream is None or self.streams is None:
+            return True
+        if callable(self.streams):
+            return bool(self.streams(stream))
+        return stream in self.streams
+
+    def sink(self, line, size = None, stream = None):
+        """
+        Send a line to the target, subprocess target will buffer the line.
+        """
+        before = time.perf_counter()
+        if isinstance(self.target, Popen):
+            line = '{}\n'.format(line).encode()
+            size = len(line)
+            r = self.write(line)
+        else:
+            r = self.target.parse(line)
+            if size is None:
+                size = len(line.encode())
+
+        self._metrics.observe('sink', time.perf_counter() - before)
+        self._metrics.row(size, stream)
+        return r
+
+    def write(self, line):
+        """
+        Append an encoded line into the buffer, flush if reached any of the thresholds.
+        """
+        with self.lock:
+            if not len(self._buffer):
+                self._buffer_start = time.time()
+            self._buffer.append(line)
+            self._buffer_size += len(line)
+            if len(self._buffer) >= self.buffer_rows or (
+                self.buffer_bytes > 0 and self._buffer_size >= self.buffer_bytes
+            ):
+                return self._flush()
+
+    def flush(self, expired = False):
+        """
+        Flush the buffer into target stdin, if `expired`, only flush when buffer older than `buffer_time`.
+        """
+        with self.lock:
+            if not len(self._buffer):
+                return
+            if (
+                expired
+                and time.time() - self._buffer_start < self.buffer_time
+            ):
+                return
+            return self._flush()
+
+    def _flush(self):
+        self.target.stdin.write(b''.join(self._buffer))
+        self.target.stdin.flush()
+        self._buffer = []
+        self._buffer_size = 0
+        self._buffer_start = None
+
+    def output(self, line, log = None):
+        """
+        Keep a line emitted by the target, usually a STATE, in `outputs` ring buffer.
+        """
+        line = line.decode().strip()
+        if not len(line):
+            return
+        self.outputs.append(line)
+        self._metrics.outputs += 1
+        try:
+            self.state = codec.loads(line)
+        except ValueError:
+            pass
+        if log is not None:
+            log.log(self.name, line)
 
-        self._tap_count = Counter(f'total_{f}', f'total rows {f}')
-        self._tap_data = Summary(
-            f'data_size_{f}', f'summary of data size {f} (KB)'
-        )
-        self._tap_data_histogram = Histogram(
-            f'data_size_histogram_{f}', f'histogram of data size {f} (KB)'
-        )
+
+class Sink(threading.Thread):
+    def __init__(self, target, queue_size, log = None):
+        self.target = target
+        self.queue = queue.Queue(maxsize = queue_size)
+        self.log = log
+        self.error = None
+        threading.Thread.__init__(self, daemon = True)
+
+    def put(self, line, size = None, stream = None):
+        """
+        Enqueue a line for the target, block while the queue is full.
+        """
+        line = (line, size, stream)
+        try:
+            self.queue.put_nowait(line)
+        except queue.Full:
+            before = time.time()
+            while True:
+                if self.error is not None:
+                    raise self.error
+                try:
+                    self.queue.put(line, timeout = 1)
+                    break
+                except queue.Full:
+                    pass
+            self.target._metrics.blocked_time += time.time() - before
+
+        if self.error is not None:
+            raise self.error
+        self.target._metrics.queue_size = self.queue.qsize()
+
+    def close(self):
+        """
+        Wait until all queued lines are sent to the target.
+        """
+        if self.error is None:
+            self.queue.put(None)
+            self.join()
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        while True:
+            line = self.queue.get()
+            if line is None:
+                break
+            try:
+                r = self.target.sink(*line)
+            except Exception as e:
+                self.error = e
+                break
+            if self.log is not None and r is not None:
+                self.log.log(self.target.name, r)
+            self.target._metrics.queue_size = self.queue.qsize()
+
+
+class Spool_Sink(threading.Thread):
+    def __init__(
+        self,
+        target,
+        spool,
+        log = None,
+        ack_interval = 1,
+        ack = 'write',
+        max_states = 1000,
+    ):
+        self.target = target
+        self.spool = spool
+        self.log = log
+        self.ack_interval = ack_interval
+        self.ack = ack
+        self.error = None
+        self.stopped = threading.Event()
+        self._schemas = {}
+        # oldest unconfirmed STATE dropped if full, a newer confirmed STATE acknowledges its rows.
+        self._states = deque(maxlen = max_states)
+        self._stateful = False
+        threading.Thread.__init__(self, daemon = True)
+
+    def put(self, line, size = None, stream = None):
+        """
+        Append a line into the spool, block while the spool is full.
+        """
+        line = line.encode()
+        if not self.spool.put(line, timeout = 0):
+            before = time.time()
+            while not self.spool.put(line, timeout = 1):
+                if self.error is not None:
+                    raise self.error
+            self.target._metrics.blocked_time += time.time() - before
+
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        """
+        Wait until all spooled lines are sent to the target.
+        """
+        self.stopped.set()
+        self.join()
+        self.spool.close()
+        if self.error is not None:
+            raise self.error
+
+    def _sink(self, line, stream = None):
+        r = self.target.sink(line, None, stream)
+        if self.log is not None and r is not None:
+            self.log.log(self.target.name, r)
+
+    def _ack(self, offset):
+        self.target.flush()
+        if not self._stateful:
+            if offset is not None:
+                self.spool.ack(offset, list(self._schemas.values()))
+            return
+
+        # a subprocess target confirms rows before a STATE by emitting the STATE value.
+        confirmed = None
+        for i, (value, _, _) in enumerate(self._states):
+            if value == self.target.state:
+                confirmed = i
+        if confirmed is not None:
+            for _ in range(confirmed):
+                self._states.popleft()
+            _, offset, schemas = self._states.popleft()
+            self.spool.ack(offset, schemas)
+
+    def run(self):
+        offset, before = None, time.time()
+        try:
+            for line in self.spool.schemas:
+                _, stream = function.classify(line)
+                self._schemas[stream] = line
+                self._sink(line)
+
+            while True:
+                record = self.spool.get(timeout = 0.1)
+                if record is None:
+                    if offset is not None or len(self._states):
+                        self._ack(offset)
+                        offset = None
+                    if self.stopped.is_set():
+                        break
+                    continue
+
+                line, offset = record
+                line = line.decode()
+                message_type, stream = function.classify(line)
+                if message_type == 'SCHEMA':
+                    self._schemas[stream] = line
+                elif (
+                    message_type == 'STATE'
+                    and self.ack == 'state'
+                    and isinstance(self.target.target, Popen)
+                ):
+                    self._stateful = True
+                    self._states.append(
+                        (
+                            codec.loads(line).get('value'),
+                            offset,
+                            list(self._schemas.values()),
+                        )
+                    )
+                if message_type != 'RECORD':
+                    stream = None
+                self._sink(line, stream)
+                if time.time() - before >= self.ack_interval:
+                    self._ack(offset)
+                    offset, before = None, time.time()
+        except Exception as e:
+            self.error = e
+
+
+class Post_Batch(threading.Thread):
+    def __init__(self, post_function, tap_name, pipes, batch, interval):
+        self.post_function = post_function
+        self.tap_name = tap_name
+        self.pipes = pipes
+        self.batch = batch
+        self.interval = interval
+        self.error = None
+        self.stopped = threading.Event()
+        self._full = threading.Event()
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._reset()
+        threading.Thread.__init__(self, daemon = True)
+
+    def _reset(self):
+        self._rows = 0
+        self._size = 0
+        self._streams = {}
+        self._first = None
+        self._last = None
+
+    def add(self, size, stream = None):
+        """
+        Aggregate a line, `post_function` will be called from the thread.
+        """
+        if self.error is not None:
+            raise self.error
+        now = time.time()
+        with self._lock:
+            if self._first is None:
+                self._first = now
+            self._last = now
+            self._rows += 1
+            self._size += size
+            if stream is not None:
+                self._streams[stream] = self._streams.get(stream, 0) + 1
+            full = self.batch > 0 and self._rows >= self.batch
+        if full:
+            self._full.set()
+
+    def close(self):
+        """
+        Call `post_function` for the remaining lines and stop the thread.
+        """
+        self.stopped.set()
+        self._full.set()
+        self.join()
+        if self.error is not None:
+            raise self.error
+
+    def _latencies(self):
+        latencies = {}
+        for pipe in self.pipes:
+            histogram = pipe._metrics.latency.get('sink')
+            if histogram is None:
+                continue
+            count, total = sum(histogram.counts), histogram.sum
+            previous_count, previous_total = self._latency.get(
+                pipe.name, (0, 0.0)
+            )
+            self._latency[pipe.name] = (count, total)
+            if count > previous_count:
+                latencies[pipe.name] = (total - previous_total) / (
+                    count - previous_count
+                )
+        return latencies
+
+    def _post(self):
+        with self._lock:
+            if not self._rows:
+                return
+            metadata = {
+                'tap_name': self.tap_name,
+                'timestamp': str(datetime.now()),
+                'rows': self._rows,
+                'streams': self._streams,
+                'size': self._size,
+                'first_timestamp': str(datetime.fromtimestamp(self._first)),
+                'last_timestamp': str(datetime.fromtimestamp(self._last)),
+            }
+            self._reset()
+        metadata['latency'] = self._latencies()
+        self.post_function(metadata)
+
+    def run(self):
+        try:
+            while not self.stopped.is_set():
+                self._full.wait(self.interval or None)
+                self._full.clear()
+                self._post()
+            self._post()
+        except Exception as e:
+            self.error = e
+
+
+class Check_Buffer(threading.Thread):
+    def __init__(self, pipes, buffer_time):
+        self.pipes = pipes
+        self.buffer_time = buffer_time
+        self.stopped = threading.Event()
+        threading.Thread.__init__(self, daemon = True)
+
+    def run(self):
+        while not self.stopped.wait(self.buffer_time / 2):
+            for pipe in self.pipes:
+                pipe.flush(expired = True)
+
+
+class Check_Summary(threading.Thread):
+    def __init__(self, metrics, pipes, interval, log = None):
+        self.metrics = metrics
+        self.pipes = pipes
+        self.interval = interval
+        self.log = log
+        self.stopped = threading.Event()
+        threading.Thread.__init__(self, daemon = True)
+
+    def run(self):
+        before = time.time()
+        last = {}
+        while not self.stopped.wait(self.interval):
+            now = time.time()
+            elapsed = max(now - before, 1e-9)
+            before = now
+            rows = []
+            for m in [self.metrics] + [pipe._metrics for pipe in self.pipes]:
+                name = m.labels[1] or 'tap'
+                count = sum(m.size.counts)
+                size = m.size.sum
+                previous_count, previous_size = last.get(name, (0, 0.0))
+                last[name] = (count, size)
+                rows.append(
+                    '{}: {} rows, {:.1f} rows/s, {:.1f} KB/s'.format(
+                        name,
+                        count,
+                        (count - previous_count) / elapsed,
+                        (size - previous_size) / elapsed,
+                    )
+                )
+            for stream, count in list(self.metrics.streams.items()):
+                previous_count = last.get(('stream', stream), 0)
+                last[('stream', stream)] = count
+                rows.append(
+                    'stream {}: {} rows, {:.1f} rows/s'.format(
+                        stream, count, (count - previous_count) / elapsed
+                    )
+                )
+            if self.log is not None:
+                rows.append(f'{self.log.skipped} debug lines skipped')
+            logger.info(
+                'pipeline {} summary, {}'.format(
+                    self.metrics.labels[0], '; '.join(rows)
+                )
+            )
 
 
 class Check_Error(threading.Thread):
@@ -111,81 +753,150 @@ class Check_Error(threading.Thread):
 
 
 class Check_Pipe(threading.Thread):
-    def __init__(self, pipe, debug):
-        self.pipe = pipe
-        self.debug = debug
-        threading.Thread.__init__(self)
+    def __init__(self, target, log = None):
+        self.target = target
+        self.log = log
+        threading.Thread.__init__(self, daemon = True)
 
     def run(self):
-        try:
-            while True:
-                output = function.non_block_read(self.pipe).strip()
-                if output and self.debug:
-                    logger.info(output)
-        except:
-            pass
-
-
-def transformation(rows, builder, function: Callable, tap_schema = None):
+        with self.target.target.stdout:
+            for line in iter(self.target.target.stdout.readline, b''):
+                self.target.output(line, self.log)
+
+
+async def check_pipe(target, log = None):
+    while True:
+        line = await target.target.stdout.readline()
+        if not len(line):
+            break
+        target.output(line, log)
+
+
+def _transform_record(record, function):
+    record = function(record)
+    if not record:
+        return [], None
+    if isinstance(record, tuple):
+        if len(record) != 2:
+            raise ValueError(
+                'transformation must returned (row, dictionary) or row.'
+            )
+        record, types = record
+    else:
+        types = None
+    return [record], types
+
+
+def _transform_batch(records, function, dataframe = False):
+    if dataframe:
+        import pandas as pd
+
+        records = pd.DataFrame(records)
+    records = function(records)
+    if isinstance(records, tuple):
+        if len(records) != 2:
+            raise ValueError(
+                'transformation must returned (rows, dictionary) or rows.'
+            )
+        records, types = records
+    else:
+        types = None
+    if records is None:
+        return [], types
+    if dataframe:
+        records = records.astype(object).where(records.notnull(), None)
+        records = records.to_dict(orient = 'records')
+    if not isinstance(records, list):
+        raise ValueError('batch transformation must returned a list of rows.')
+    return records, types
+
+
+def apply_transformation(
+    rows, function: Callable, batch = False, dataframe = False
+):
+    """
+    Parse rows and apply `function` on records, able to run in a separate process.
+
+    Returns
+    -------
+    result : list of non-record lines and (stream, records, types).
+    """
 
     results = []
+    stream, records = None, []
+
+    def flush():
+        nonlocal records
+        if len(records):
+            transformed, types = _transform_batch(records, function, dataframe)
+            results.append((stream, transformed, types))
+            records = []
 
     for line in rows:
         try:
-            msg = singer.parse_message(line)
-        except json.decoder.JSONDecodeError:
+            msg = codec.loads(line)
+        except ValueError:
             logger.error('Unable to parse:\n{}'.format(line))
             raise
 
-        if isinstance(msg, singer.RecordMessage):
-            record = msg.record
-            record = function(record)
-            if record:
-                if isinstance(record, tuple):
-                    if len(record) != 2:
-                        raise ValueError(
-                            'transformation must returned (row, dictionary) or row.'
-                        )
-                    record, types = record
-                else:
-                    types = None
-                builder.add_object(record)
-                schema = builder.to_schema()
-                if tap_schema:
-                    for k, v in tap_schema['properties'].items():
-                        if k in schema['properties']:
-                            schema['properties'][k] = v
-                if types:
-                    for k, v in types.items():
-                        if k in schema['properties']:
-                            v = type_mapping.get(v, v)
-                            if not isinstance(v, str):
-                                raise ValueError(
-                                    f'value {v} from {k} not supported.'
-                                )
-                            schema['properties'][k] = {'type': v}
-
-                tap_name = msg.stream
-                r = SchemaMessage(
-                    stream = tap_name,
-                    schema = schema,
-                    key_properties = None,
-                    bookmark_properties = None,
-                )
-                s = format_message(r)
-                r = RecordMessage(
-                    stream = tap_name, record = record, time_extracted = None
-                )
-                r = format_message(r)
-                row = [s.encode(), r.encode()]
-                results.extend(row)
+        if msg.get('type') == 'RECORD':
+            if batch:
+                if msg['stream'] != stream:
+                    flush()
+                    stream = msg['stream']
+                records.append(msg['record'])
+            else:
+                transformed, types = _transform_record(msg['record'], function)
+                results.append((msg['stream'], transformed, types))
 
         else:
+            flush()
             results.append(line)
 
+    flush()
     return results
 
 
+def emit_transformation(results, builder):
+    """
+    Convert results from `apply_transformation` into singer lines, schema inferred by `builder`.
+    """
+    lines = []
+    for result in results:
+        if isinstance(result, tuple):
+            stream, records, types = result
+            for record in records:
+                _emit_record(lines, builder, stream, record, types)
+        else:
+            line = result.decode() if isinstance(result, bytes) else result
+            message_type, stream = function.classify(line)
+            if message_type == 'SCHEMA':
+                builder.forget(stream)
+            lines.append(result)
+    return lines
+
+
+def transformation(
+    rows, builder, function: Callable, batch = False, dataframe = False
+):
+    results = apply_transformation(rows, function, batch, dataframe)
+    return emit_transformation(results, builder)
+
+
+def _emit_record(results, builder, stream, record, types = None):
+    schema = builder.add(stream, record, types)
+    if schema is not None:
+        r = SchemaMessage(
+            stream = stream,
+            schema = schema,
+            key_properties = None,
+            bookmark_properties = None,
+        )
+        results.append(codec.format_message(r))
+    r = RecordMessage(stream = stream, record = record, time_extracted = None)
+    results.append(codec.format_message(r))
+
+
 class Encoder(json.JSONEncoder):
     def default(self, obj):
         if isinstance(obj, date) or isinstance(obj, datetime):
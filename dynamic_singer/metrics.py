@@ -0,0 +1,245 @@
+import threading
+from bisect import bisect_left
+from dynamic_singer import function
+from prometheus_client import REGISTRY, start_http_server
+from prometheus_client.core import (
+    CounterMetricFamily,
+    GaugeMetricFamily,
+    HistogramMetricFamily,
+    SummaryMetricFamily,
+)
+from prometheus_client.utils import floatToGoString
+
+size_buckets = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.075,
+    0.1,
+    0.25,
+    0.5,
+    0.75,
+    1.0,
+    2.5,
+    5.0,
+    7.5,
+    10.0,
+)
+latency_buckets = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1.0,
+    5.0,
+    10.0,
+)
+
+
+class Histogram:
+    __slots__ = ('buckets', 'counts', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self):
+        bounds = [floatToGoString(b) for b in self.buckets] + ['+Inf']
+        cumulative, buckets = 0, []
+        for bound, count in zip(bounds, self.counts):
+            cumulative += count
+            buckets.append((bound, cumulative))
+        return buckets, self.sum
+
+
+class Metrics:
+    def __init__(self, pipeline: str, target: str = ''):
+        """
+        Metrics for a tap or a target. Hot path only updates local python counters, prometheus registry reads them during scraping.
+
+        Parameters
+        ----------
+        pipeline: str
+            pipeline name, `pipeline` label.
+        target: str, (default='')
+            target name, `target` label, empty for the tap.
+        """
+        self.labels = [pipeline, target]
+        self.size = Histogram(size_buckets)
+        self.latency = {}
+        self.streams = {}
+        self.queue_size = 0
+        self.blocked_time = 0.0
+        self.outputs = 0
+        self.gauges = {}
+
+    def row(self, size, stream = None):
+        """
+        Count a row with its size in bytes.
+        """
+        self.size.observe(size / 1000)
+        if stream is not None:
+            self.streams[stream] = self.streams.get(stream, 0) + 1
+
+    def observe(self, stage, seconds):
+        """
+        Observe latency of a stage, in seconds.
+        """
+        histogram = self.latency.get(stage)
+        if histogram is None:
+            histogram = Histogram(latency_buckets)
+            self.latency[stage] = histogram
+        histogram.observe(seconds)
+
+
+class Collector:
+    def __init__(self):
+        """
+        Single prometheus collector for all pipelines in the process, every sample labelled by `pipeline` and `target`.
+        """
+        self._metrics = {}
+        self._pipelines = set()
+        self._lock = threading.Lock()
+
+    def claim(self, pipeline, rename = True):
+        """
+        Claim a pipeline name for a `Source`, so pipelines do not share the same metrics. If the name already claimed, append a suffix, `_2`, `_3`, if `rename`, else raise an exception.
+        """
+        pipeline = function.parse_name(pipeline)
+        with self._lock:
+            name, i = pipeline, 1
+            while name in self._pipelines:
+                if not rename:
+                    raise ValueError(
+                        f'pipeline `{pipeline}` already used by another Source, use a different `pipeline`.'
+                    )
+                i += 1
+                name = f'{pipeline}_{i}'
+            self._pipelines.add(name)
+            return name
+
+    def get(self, pipeline, target = ''):
+        """
+        Get or create metrics for a pipeline and a target.
+        """
+        pipeline = function.parse_name(pipeline)
+        if len(target):
+            target = function.parse_name(target)
+        with self._lock:
+            key = (pipeline, target)
+            if key not in self._metrics:
+                self._metrics[key] = Metrics(pipeline, target)
+            return self._metrics[key]
+
+    def collect(self):
+        labels = ['pipeline', 'target']
+        rows = CounterMetricFamily(
+            'dynamic_singer_rows', 'total rows', labels = labels
+        )
+        size = SummaryMetricFamily(
+            'dynamic_singer_data_size',
+            'summary of data size (KB)',
+            labels = labels,
+        )
+        size_histogram = HistogramMetricFamily(
+            'dynamic_singer_data_size_histogram',
+            'histogram of data size (KB)',
+            labels = labels,
+        )
+        latency = HistogramMetricFamily(
+            'dynamic_singer_latency',
+            'histogram of latency for each stage (seconds)',
+            labels = labels + ['stage'],
+        )
+        streams = CounterMetricFamily(
+            'dynamic_singer_stream_rows',
+            'total rows for each stream',
+            labels = labels + ['stream'],
+        )
+        queue_size = GaugeMetricFamily(
+            'dynamic_singer_queue_size', 'rows waiting in queue', labels = labels
+        )
+        blocked_time = CounterMetricFamily(
+            'dynamic_singer_blocked_time',
+            'total seconds tap blocked by full queue',
+            labels = labels,
+        )
+        outputs = CounterMetricFamily(
+            'dynamic_singer_outputs',
+            'total lines emitted by target',
+            labels = labels,
+        )
+
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        gauges = {}
+        for m in metrics:
+            for name, value in list(m.gauges.items()):
+                if name not in gauges:
+                    gauges[name] = GaugeMetricFamily(
+                        f'dynamic_singer_{name}',
+                        name.replace('_', ' '),
+                        labels = labels,
+                    )
+                gauges[name].add_metric(m.labels, value)
+
+        for m in metrics:
+            buckets, size_sum = m.size.samples()
+            count = buckets[-1][1]
+            rows.add_metric(m.labels, count)
+            size.add_metric(m.labels, count, size_sum)
+            size_histogram.add_metric(m.labels, buckets, size_sum)
+            for stage, histogram in list(m.latency.items()):
+                buckets, latency_sum = histogram.samples()
+                latency.add_metric(m.labels + [stage], buckets, latency_sum)
+            for stream, count in list(m.streams.items()):
+                streams.add_metric(m.labels + [stream], count)
+            queue_size.add_metric(m.labels, m.queue_size)
+            blocked_time.add_metric(m.labels, m.blocked_time)
+            outputs.add_metric(m.labels, m.outputs)
+
+        yield rows
+        yield size
+        yield size_histogram
+        yield latency
+        yield streams
+        yield queue_size
+        yield blocked_time
+        yield outputs
+        for gauge in gauges.values():
+            yield gauge
+
+
+collector = Collector()
+REGISTRY.register(collector)
+_servers = set()
+_servers_lock = threading.Lock()
+
+
+def get(pipeline, target = ''):
+    return collector.get(pipeline, target)
+
+
+def claim(pipeline, rename = True):
+    return collector.claim(pipeline, rename)
+
+
+def start_server(port):
+    """
+    Start prometheus exporter on `port` once, pipelines in the same process share the exporter.
+    """
+    with _servers_lock:
+        if port and port not in _servers:
+            start_http_server(port)
+            _servers.add(port)
@@ -1,43 +1,39 @@
-import json
 import os
+import asyncio
 import re
-import sys
+import hashlib
 import singer
 import time
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from subprocess import Popen, PIPE, STDOUT
-from dynamic_singer import helper, function
+from dynamic_singer import helper, function, codec, metrics, spool
 from typing import Callable, Dict
 from herpetologist import check_type
-from tornado import gen
-from prometheus_client import start_http_server, Counter, Summary, Histogram
 import logging
 from datetime import datetime
 
 logger = logging.getLogger()
 
+# maximum size of a line read from asyncio subprocess streams.
+_stream_limit = 2 ** 24
 
-@gen.coroutine
-def _sinking(line, target):
-    if isinstance(target.target, Popen):
-        target.target.stdin.write('{}\n'.format(line).encode())
-        target.target.stdin.flush()
+# rows sent to a transformation worker if `transformation_batch` is 0.
+_transformation_chunk = 1000
 
-        r = []
-        while True:
-            output = function.non_block_read(target.target.stdout).strip()
-            if len(output):
-                r.append(output.decode().strip())
-            else:
-                break
-        r = '\n'.join(r)
 
-    else:
-        r = target.target.parse(line)
+async def _asinking(line, target, size = None, stream = None):
+    if isinstance(target.target, asyncio.subprocess.Process):
+        before = time.perf_counter()
+        line = '{}\n'.format(line).encode()
+        target.target.stdin.write(line)
+        await target.target.stdin.drain()
+        target._metrics.observe('sink', time.perf_counter() - before)
+        target._metrics.row(len(line), stream)
+        return
 
-    target._tap_count.inc()
-    target._tap_data.observe(sys.getsizeof(r) / 1000)
-    target._tap_data_histogram.observe(sys.getsizeof(r) / 1000)
-    return r
+    return target.sink(line, size, stream)
 
 
 class Source:
@@ -49,6 +45,7 @@ class Source:
         tap_name: str = None,
         tap_key: str = None,
         port: int = 8000,
+        pipeline: str = None,
     ):
         """
         Parameters
@@ -58,11 +55,13 @@ class Source:
         tap_schema: Dict, (default=None)
             data schema if tap an object. If `tap_schema` is None, it will auto generate schema.
         tap_name: str, (default=None)
-            name for tap, necessary if tap is an object. it will throw an error if not a string if tap is an object.
+            name for tap, necessary if tap is an object. it will throw an error if not a string if tap is an object. For a subprocess tap, key of its STATE value if more than one tap, if None, will use the tap command.
         tap_key: str, (default=None)
             important non-duplicate key from `tap.emit()`, usually a timestamp.
         port: int, (default=8000)
-            prometheus exporter port.
+            prometheus exporter port, pipelines in the same process can share the same port. If 0, will not start the exporter.
+        pipeline: str, (default=None)
+            pipeline name for `pipeline` label in prometheus exporter, must be unique in the process. If None, will use tap name, with a suffix `_2`, `_3` if already used by another Source.
         """
         if not isinstance(tap, str) and not hasattr(tap, 'emit'):
             raise ValueError(
@@ -84,24 +83,87 @@ class Source:
             f = tap
 
         self.tap_name = tap_name
+        self._taps = [self.tap]
+        self._tap_names = {}
+        if isinstance(tap, str):
+            self._tap_names[tap] = tap_name or tap
         self._targets = []
-        start_http_server(port)
-        f = function.parse_name(f)
+        self._options = []
+        self._validated = set()
+        metrics.start_server(port)
+        self.pipeline = metrics.claim(pipeline or f, rename = pipeline is None)
+        self._metrics = metrics.get(self.pipeline)
 
-        self._tap_count = Counter(f'total_{f}', f'total rows {f}')
-        self._tap_data = Summary(
-            f'data_size_{f}', f'summary of data size {f} (KB)'
-        )
-        self._tap_data_histogram = Histogram(
-            f'data_size_histogram_{f}', f'histogram of data size {f} (KB)'
-        )
+    @check_type
+    def add_tap(
+        self,
+        tap,
+        tap_schema: dict = None,
+        tap_name: str = None,
+        tap_key: str = None,
+    ):
+        """
+        Add another tap, all taps will be read concurrently and their messages interleaved into the same targets.
+
+        Parameters
+        ----------
+        tap: str / object
+            tap source.
+        tap_schema: Dict, (default=None)
+            data schema if tap an object. If `tap_schema` is None, it will auto generate schema.
+        tap_name: str, (default=None)
+            name for tap, necessary if tap is an object. it will throw an error if not a string if tap is an object. For a subprocess tap, key of its STATE value if more than one tap, if None, will use the tap command.
+        tap_key: str, (default=None)
+            important non-duplicate key from `tap.emit()`, usually a timestamp.
+        """
+        if not isinstance(tap, str) and not hasattr(tap, 'emit'):
+            raise ValueError(
+                'tap must a string or an object with method `emit`'
+            )
+
+        if hasattr(tap, '__dict__'):
+            tap = helper.Tap(
+                tap,
+                tap_schema = tap_schema,
+                tap_name = tap_name,
+                tap_key = tap_key,
+            )
+        else:
+            self._tap_names[tap] = tap_name or tap
+        self._taps.append(tap)
+
+    def get_taps(self):
+        """
+        Returns
+        ----------
+        result: list of taps
+        """
+        return self._taps
 
-    def add(self, target):
+    def add(
+        self,
+        target,
+        streams = None,
+        spool: str = None,
+        spool_size: int = 1073741824,
+        spool_ack: str = 'write',
+    ):
         """
         Parameters
         ----------
         target: str / object
             target source.
+        streams: list / Callable, (default=None)
+            If not None, only send messages of streams in `streams` to the target, or streams that `streams(stream)` returned True. STATE messages always sent to the target.
+        spool: str, (default=None)
+            If not None, rows will be appended into a spool on disk in `spool` directory, and the target consumes from the spool at its own pace. After a restart, the target will receive the latest SCHEMA of every stream and resume from the last acknowledged row. Only for `start`.
+        spool_size: int, (default=1073741824)
+            maximum bytes of the spool on disk, tap will block if reached.
+        spool_ack: str, (default='write')
+            how the spool acknowledges rows. Allowed values:
+
+            * ``'write'`` - every second after rows written into the target.
+            * ``'state'`` - after a subprocess target emitted the value of a STATE sent after the rows. The target must emit every STATE after committed the rows before it, else the spool never acknowledged and the tap will block after `spool_size` reached.
         """
         if not isinstance(target, str) and not hasattr(target, 'parse'):
             raise ValueError(
@@ -111,7 +173,23 @@ class Source:
         if isinstance(target, str):
             if '.py' in target:
                 target = f'python3 {target}'
+        if spool_size < 1:
+            raise ValueError('`spool_size` must bigger than 0')
+        if spool_ack not in ('write', 'state'):
+            raise ValueError("`spool_ack` only supported 'write' or 'state'")
+        if isinstance(streams, (list, tuple, set)):
+            streams = frozenset(streams)
+        elif streams is not None and not callable(streams):
+            raise ValueError('streams must a list of string or a callable')
         self._targets.append(target)
+        self._options.append(
+            {
+                'streams': streams,
+                'spool': spool,
+                'spool_size': spool_size,
+                'spool_ack': spool_ack,
+            }
+        )
 
     def get_targets(self):
         """
@@ -130,6 +208,188 @@ class Source:
             target index from `get_targets()`.
         """
         self._targets.pop(index)
+        self._options.pop(index)
+
+    def _prepare(self, line, log, ignore_null):
+        line = line.strip()
+        size = len(line)
+        if not size:
+            return None, None, None, None
+        line = line.decode()
+
+        message_type, stream = function.classify(line)
+
+        if log is not None:
+            log.log(stream or message_type, line)
+
+        if message_type == 'SCHEMA' and not ignore_null:
+            fingerprint = hashlib.md5(line.encode()).hexdigest()
+            if fingerprint not in self._validated:
+                l = codec.loads(line)
+                for k, v in l['schema']['properties'].items():
+                    if v['type'].lower() == 'null':
+                        raise ValueError(
+                            f'{k} is a NULL, some of database cannot accept NULL schema. To ignore this exception, simply set `ignore_null` = True.'
+                        )
+                self._validated.add(fingerprint)
+
+        self._metrics.row(size, stream if message_type == 'RECORD' else None)
+        return line, message_type, stream, size
+
+    def _route(self, routes, stream, sinks, pipes):
+        route = routes.get(stream)
+        if route is None:
+            route = (
+                [sink for sink in sinks if sink.target.accept(stream)],
+                [pipe for pipe in pipes if pipe.accept(stream)],
+            )
+            routes[stream] = route
+        return route
+
+    def _state(self, lines, tap):
+        # STATE of a subprocess tap is merged with STATE of other taps, so targets keep bookmarks of every tap.
+        if len(self._taps) < 2 or not isinstance(tap, str):
+            return lines
+        for i, line in enumerate(lines):
+            if b'"STATE"' not in line:
+                continue
+            message_type, _ = function.classify(line.decode())
+            if message_type != 'STATE':
+                continue
+            name = self._tap_names.get(tap, tap)
+            self._states[name] = codec.loads(line).get('value')
+            lines[i] = codec.dumps({'type': 'STATE', 'value': self._states})
+        return lines
+
+    def _read(self, lines, tap):
+        if len(lines) and isinstance(tap, helper.Tap):
+            self._rows[tap] = self._rows.get(tap, 0) + 1
+
+    def _take_rows(self):
+        rows, self._rows = self._rows, {}
+        return rows
+
+    def _deliver(self, rows):
+        for tap, count in rows.items():
+            tap.deliver(count)
+
+    def _fan_in(
+        self, graceful_shutdown, parse_error, queue_size = 1000, timeout = None
+    ):
+        taps = []
+        for tap in self._taps:
+            if isinstance(tap, str):
+                p = Popen(
+                    tap.split(), stdout = PIPE, stdin = PIPE, stderr = PIPE
+                )
+                t = helper.Check_Error(p, graceful_shutdown, parse_error)
+                t.start()
+                taps.append((tap, p))
+            else:
+                tap.reset()
+                taps.append((tap, tap))
+        return helper.Fan_In(taps, queue_size, timeout)
+
+    def _transform(
+        self,
+        lines,
+        transformation,
+        builder,
+        batch_size,
+        dataframe,
+        executor = None,
+        flush = False,
+        age = 0,
+        block = True,
+    ):
+        if not transformation:
+            return lines, self._take_rows()
+        batch = batch_size > 0
+        if executor is not None:
+            batch_size = batch_size or _transformation_chunk
+        if batch_size > 0:
+            if len(lines) and not len(self._pending):
+                self._pending_time = time.time()
+            self._pending.extend(lines)
+            expired = (
+                age > 0
+                and len(self._pending)
+                and time.time() - self._pending_time >= age
+            )
+            if len(self._pending) >= batch_size or flush or expired:
+                lines, self._pending = self._pending, []
+            else:
+                lines = []
+
+        if executor is None:
+            if not len(lines):
+                return [], {}
+            return (
+                helper.transformation(
+                    lines,
+                    builder,
+                    transformation,
+                    batch = batch,
+                    dataframe = dataframe,
+                ),
+                self._take_rows(),
+            )
+
+        if len(lines):
+            self._futures.append(
+                (
+                    executor.submit(
+                        helper.apply_transformation,
+                        lines,
+                        transformation,
+                        batch,
+                        dataframe,
+                    ),
+                    self._take_rows(),
+                )
+            )
+        return self._collect(builder, flush = flush, block = block)
+
+    def _blocked(self, flush):
+        return len(self._futures) and (
+            flush or len(self._futures) >= self._max_futures
+        )
+
+    def _collect(self, builder, flush = False, block = True):
+        results, rows = [], {}
+        while len(self._futures) and (
+            self._futures[0][0].done() or (block and self._blocked(flush))
+        ):
+            future, future_rows = self._futures.popleft()
+            results.extend(
+                helper.emit_transformation(future.result(), builder)
+            )
+            self._merge(rows, future_rows)
+        return results, rows
+
+    def _merge(self, rows, other):
+        for tap, count in other.items():
+            rows[tap] = rows.get(tap, 0) + count
+
+    def _ack(self, post_function, post_batch = None, size = 0, stream = None):
+        if post_batch is not None:
+            post_batch.add(size, stream)
+        elif post_function is not None:
+            post_function(
+                {'tap_name': self.tap_name, 'timestamp': str(datetime.now())}
+            )
+
+    def _idle(self, transformation, batch, workers, seconds):
+        if transformation and (batch > 0 or workers > 0):
+            return seconds
+        return 0
+
+    def _builder(self, transformation):
+        if transformation:
+            builder = helper.Infer_Schema(tap_schema = self.tap_schema)
+        else:
+            builder = None
+        return builder
 
     @check_type
     def start(
@@ -141,6 +401,20 @@ class Source:
         graceful_shutdown: int = 30,
         post_function: Callable = None,
         parse_error: bool = True,
+        buffer_rows: int = 1,
+        buffer_bytes: int = 0,
+        buffer_time: int = 0,
+        queue_size: int = 1000,
+        transformation_batch: int = 0,
+        transformation_dataframe: bool = False,
+        transformation_workers: int = 0,
+        debug_sample: int = 1,
+        debug_rate: int = 0,
+        debug_summary: int = 0,
+        post_batch: int = 0,
+        post_interval: int = 0,
+        transformation_time: int = 1,
+        tap_state: dict = None,
     ):
         """
         Parameters
@@ -148,7 +422,7 @@ class Source:
         transformation: Callable, (default=None)
             a callable variable to transform tap data, this will auto generate new data schema.
         asynchronous: bool, (default=False)
-            If True, emit to targets in async manner, else, loop from first target until last target.
+            If True, each target will consume from its own queue in a separate thread, else, loop from first target until last target.
         debug: bool, (default=True)
             If True, will print every rows emitted and parsed.
         ignore_null: bool, (default=True)
@@ -159,15 +433,68 @@ class Source:
             If callable, it will pass metadata to the function.
         parse_error: bool, (default=True)
             If True, last 3 rows of errors will put as extra parameter in logging.error. This is useful for sentry.io purpose.
+        buffer_rows: int, (default=1)
+            flush buffered rows into subprocess targets after reached `buffer_rows` rows.
+        buffer_bytes: int, (default=0)
+            If bigger than 0, flush buffered rows into subprocess targets after reached `buffer_bytes` bytes.
+        buffer_time: int, (default=0)
+            If bigger than 0, flush buffered rows into subprocess targets after buffered more than `buffer_time` seconds.
+        queue_size: int, (default=1000)
+            maximum rows waiting for each target if `asynchronous` is True, tap will block if the queue is full.
+        transformation_batch: int, (default=0)
+            If bigger than 0, `transformation` will receive a list of rows, up to `transformation_batch` rows, and must returned a list of rows. Remove a row from the list to filter it.
+        transformation_dataframe: bool, (default=False)
+            If True and `transformation_batch` bigger than 0, `transformation` will receive a pandas DataFrame and must returned a pandas DataFrame.
+        transformation_workers: int, (default=0)
+            If bigger than 0, run `transformation` in `transformation_workers` processes, `transformation` must be picklable, a lambda is not.
+        debug_sample: int, (default=1)
+            If `debug` is True, only print 1 in every `debug_sample` rows for each stream and each target.
+        debug_rate: int, (default=0)
+            If `debug` is True and bigger than 0, only print at most `debug_rate` rows per second for each stream and each target.
+        debug_summary: int, (default=0)
+            If bigger than 0, print throughput of tap, targets and streams every `debug_summary` seconds, even if `debug` is False.
+        post_batch: int, (default=0)
+            If bigger than 0, `post_function` will be called once every `post_batch` rows in a separate thread with aggregated metadata.
+        post_interval: int, (default=0)
+            If bigger than 0, `post_function` will be called once every `post_interval` seconds in a separate thread with aggregated metadata.
+        transformation_time: int, (default=1)
+            If bigger than 0, rows waiting for `transformation_batch` or `transformation_workers` will be transformed after waited `transformation_time` seconds, even if the tap is idle.
+        tap_state: Dict, (default=None)
+            If more than one tap, STATE values of subprocess taps are merged into a single STATE keyed by tap name, `tap_state` is the initial merged value, usually the last STATE emitted by the target.
         """
         if graceful_shutdown < 0:
             raise ValueError('`graceful_shutdown` must bigger than -1')
+        if buffer_rows < 1:
+            raise ValueError('`buffer_rows` must bigger than 0')
+        if queue_size < 1:
+            raise ValueError('`queue_size` must bigger than 0')
+        if transformation_batch < 0:
+            raise ValueError('`transformation_batch` must bigger than -1')
+        if transformation_workers < 0:
+            raise ValueError('`transformation_workers` must bigger than -1')
+        if debug_sample < 1:
+            raise ValueError('`debug_sample` must bigger than 0')
+        if debug_rate < 0:
+            raise ValueError('`debug_rate` must bigger than -1')
+        if debug_summary < 0:
+            raise ValueError('`debug_summary` must bigger than -1')
+        if post_batch < 0:
+            raise ValueError('`post_batch` must bigger than -1')
+        if post_interval < 0:
+            raise ValueError('`post_interval` must bigger than -1')
+        if transformation_time < 0:
+            raise ValueError('`transformation_time` must bigger than -1')
         if not len(self._targets):
             raise Exception(
                 'targets are empty, please add a target using `source.add()` first.'
             )
+        if debug:
+            log = helper.Sampled_Log(sample = debug_sample, rate = debug_rate)
+        else:
+            log = None
         self._pipes = []
-        for target in self._targets:
+        check_pipes = []
+        for target, option in zip(self._targets, self._options):
             if isinstance(target, str):
                 p = Popen(
                     target.split(), stdout = PIPE, stdin = PIPE, stderr = PIPE
@@ -177,98 +504,483 @@ class Source:
             else:
                 p = target
 
-            self._pipes.append(helper.Target(p, target))
+            pipe = helper.Target(
+                p,
+                target,
+                pipeline = self.pipeline,
+                buffer_rows = buffer_rows,
+                buffer_bytes = buffer_bytes,
+                buffer_time = buffer_time,
+                streams = option['streams'],
+            )
+            self._pipes.append(pipe)
+            if isinstance(p, Popen):
+                t = helper.Check_Pipe(pipe, log)
+                t.start()
+                check_pipes.append(t)
+
+        sinks, pipes = [], []
+        for pipe, option in zip(self._pipes, self._options):
+            if option['spool'] is not None:
+                sinks.append(
+                    helper.Spool_Sink(
+                        pipe,
+                        spool.Spool(
+                            option['spool'], max_size = option['spool_size']
+                        ),
+                        log,
+                        ack = option['spool_ack'],
+                    )
+                )
+            elif asynchronous:
+                sinks.append(helper.Sink(pipe, queue_size, log))
+            else:
+                pipes.append(pipe)
+        for sink in sinks:
+            sink.start()
+
+        if buffer_time > 0:
+            check_buffer = helper.Check_Buffer(self._pipes, buffer_time)
+            check_buffer.start()
+        else:
+            check_buffer = None
+
+        if debug_summary > 0:
+            check_summary = helper.Check_Summary(
+                self._metrics, self._pipes, debug_summary, log
+            )
+            check_summary.start()
+        else:
+            check_summary = None
+
+        if post_function is not None and (post_batch > 0 or post_interval > 0):
+            post_batch = helper.Post_Batch(
+                post_function,
+                self.tap_name,
+                self._pipes,
+                post_batch,
+                post_interval,
+            )
+            post_batch.start()
+        else:
+            post_batch = None
 
-        if isinstance(self.tap, str):
+        idle = self._idle(
+            transformation,
+            transformation_batch,
+            transformation_workers,
+            transformation_time,
+        )
+        if len(self._taps) > 1 or idle:
+            pse = self._fan_in(
+                graceful_shutdown, parse_error, queue_size, idle or None
+            )
+        elif isinstance(self.tap, str):
             pse = Popen(
                 self.tap.split(), stdout = PIPE, stdin = PIPE, stderr = PIPE
             )
             t = helper.Check_Error(pse, graceful_shutdown, parse_error)
             t.start()
 
-            pse = iter(pse.stdout.readline, b'')
+            pse = zip(
+                itertools.repeat(self.tap), iter(pse.stdout.readline, b'')
+            )
         else:
-            pse = self.tap
-            self.tap.tap.count = 0
-
-        if transformation:
-            from genson import SchemaBuilder
+            self.tap.reset()
+            pse = zip(itertools.repeat(self.tap), self.tap)
 
-            builder = SchemaBuilder()
-            builder.add_schema({'type': 'object', 'properties': {}})
+        builder = self._builder(transformation)
+        routes = {}
+        self._states = dict(tap_state or {})
+        self._rows = {}
+        self._pending = []
+        self._futures = deque()
+        if transformation and transformation_workers > 0:
+            executor = ProcessPoolExecutor(max_workers = transformation_workers)
+            self._max_futures = transformation_workers * 2
         else:
-            builder = None
+            executor = None
 
         try:
-            for lines in pse:
-                if lines is None:
-                    break
+            before = time.perf_counter()
+            for tap, lines in itertools.chain(pse, [(None, None)]):
+                self._metrics.observe('tap', time.perf_counter() - before)
+                final = lines is None
+                if final:
+                    lines = []
                 if isinstance(lines, bytes):
                     lines = [lines]
+                lines = self._state(lines, tap)
+                self._read(lines, tap)
+                before = time.perf_counter()
+                lines, rows = self._transform(
+                    lines,
+                    transformation,
+                    builder,
+                    transformation_batch,
+                    transformation_dataframe,
+                    executor = executor,
+                    flush = final or not len(lines),
+                    age = transformation_time,
+                )
                 if transformation:
-                    lines = helper.transformation(
-                        lines,
-                        builder,
-                        transformation,
-                        tap_schema = self.tap_schema,
+                    self._metrics.observe(
+                        'transformation', time.perf_counter() - before
                     )
                 for line in lines:
-                    line = line.decode().strip()
-                    if len(line):
-                        if debug:
-                            logger.info(line)
-
-                        if '"type": "SCHEMA"' in line and not ignore_null:
-                            l = json.loads(line)
-                            for k, v in l['schema']['properties'].items():
-                                if v['type'].lower() == 'null':
-                                    raise ValueError(
-                                        f'{k} is a NULL, some of database cannot accept NULL schema. To ignore this exception, simply set `ignore_null` = True.'
-                                    )
-
-                        self._tap_count.inc()
-                        self._tap_data.observe(sys.getsizeof(line) / 1000)
-                        self._tap_data_histogram.observe(
-                            sys.getsizeof(line) / 1000
+                    line, message_type, stream, size = self._prepare(
+                        line, log, ignore_null
+                    )
+                    if line is not None:
+                        routed_sinks, routed_pipes = self._route(
+                            routes, stream, sinks, pipes
                         )
+                        if message_type != 'RECORD':
+                            stream = None
+                        for sink in routed_sinks:
+                            sink.put(line, size, stream)
 
-                        if asynchronous:
-
-                            @gen.coroutine
-                            def loop():
-                                r = yield [
-                                    _sinking(line, pipe) for pipe in self._pipes
-                                ]
-
-                            result = loop()
-                            if debug:
-                                logger.info(result.result())
-
-                        else:
-                            for pipe in self._pipes:
-                                result = _sinking(line, pipe)
-                                if debug:
-                                    logger.info(result.result())
-
-                        if '"type": "RECORD"' in line and not isinstance(
-                            self.tap, str
-                        ):
-                            self.tap.tap.count += 1
-                        if post_function is not None:
-                            post_function(
-                                {
-                                    'tap_name': self.tap_name,
-                                    'timestamp': str(datetime.now()),
-                                }
-                            )
+                        for pipe in routed_pipes:
+                            result = pipe.sink(line, size, stream)
+                            if log is not None and result is not None:
+                                log.log(pipe.name, result)
+
+                        self._ack(post_function, post_batch, size, stream)
+
+                self._deliver(rows)
+
+                if final:
+                    break
+                before = time.perf_counter()
+
+            if executor is not None:
+                executor.shutdown()
+
+            for sink in sinks:
+                sink.close()
+
+            if post_batch is not None:
+                post_batch.close()
+
+            if check_buffer is not None:
+                check_buffer.stopped.set()
+
+            if check_summary is not None:
+                check_summary.stopped.set()
 
             for pipe in self._pipes:
                 if isinstance(pipe.target, Popen):
+                    pipe.flush()
                     try:
-                        pipe.target.communicate()
+                        pipe.target.stdin.close()
+                        pipe.target.wait()
                     except:
                         pass
 
+            for t in check_pipes:
+                t.join()
+
+        except Exception as e:
+            if graceful_shutdown > 0:
+                logger.error(e)
+                time.sleep(graceful_shutdown)
+                os._exit(1)
+            else:
+                raise Exception(e)
+
+    @check_type
+    async def astart(
+        self,
+        transformation: Callable = None,
+        debug: bool = True,
+        ignore_null: bool = True,
+        graceful_shutdown: int = 30,
+        post_function: Callable = None,
+        parse_error: bool = True,
+        transformation_batch: int = 0,
+        transformation_dataframe: bool = False,
+        transformation_workers: int = 0,
+        debug_sample: int = 1,
+        debug_rate: int = 0,
+        debug_summary: int = 0,
+        post_batch: int = 0,
+        post_interval: int = 0,
+        transformation_time: int = 1,
+        tap_state: dict = None,
+    ):
+        """
+        asyncio version of `start`, tap and targets are spawned using `asyncio.create_subprocess_exec` and every line is written to all targets concurrently.
+
+        Parameters
+        ----------
+        transformation: Callable, (default=None)
+            a callable variable to transform tap data, this will auto generate new data schema.
+        debug: bool, (default=True)
+            If True, will print every rows emitted and parsed.
+        ignore_null: bool, (default=True)
+            If False, if one of schema value is Null, it will throw an exception.
+        graceful_shutdown: int, (default=30)
+            If bigger than 0, any error happened, will automatically shutdown after sleep.
+        post_function: Callable, (default=None)
+            If callable, it will pass metadata to the function.
+        parse_error: bool, (default=True)
+            If True, last 3 rows of errors will put as extra parameter in logging.error. This is useful for sentry.io purpose.
+        transformation_batch: int, (default=0)
+            If bigger than 0, `transformation` will receive a list of rows, up to `transformation_batch` rows, and must returned a list of rows. Remove a row from the list to filter it.
+        transformation_dataframe: bool, (default=False)
+            If True and `transformation_batch` bigger than 0, `transformation` will receive a pandas DataFrame and must returned a pandas DataFrame.
+        transformation_workers: int, (default=0)
+            If bigger than 0, run `transformation` in `transformation_workers` processes, `transformation` must be picklable, a lambda is not.
+        debug_sample: int, (default=1)
+            If `debug` is True, only print 1 in every `debug_sample` rows for each stream and each target.
+        debug_rate: int, (default=0)
+            If `debug` is True and bigger than 0, only print at most `debug_rate` rows per second for each stream and each target.
+        debug_summary: int, (default=0)
+            If bigger than 0, print throughput of tap, targets and streams every `debug_summary` seconds, even if `debug` is False.
+        post_batch: int, (default=0)
+            If bigger than 0, `post_function` will be called once every `post_batch` rows in a separate thread with aggregated metadata.
+        post_interval: int, (default=0)
+            If bigger than 0, `post_function` will be called once every `post_interval` seconds in a separate thread with aggregated metadata.
+        transformation_time: int, (default=1)
+            If bigger than 0, rows waiting for `transformation_batch` or `transformation_workers` will be transformed after waited `transformation_time` seconds, even if the tap is idle.
+        tap_state: Dict, (default=None)
+            If more than one tap, STATE values of subprocess taps are merged into a single STATE keyed by tap name, `tap_state` is the initial merged value, usually the last STATE emitted by the target.
+        """
+        if graceful_shutdown < 0:
+            raise ValueError('`graceful_shutdown` must bigger than -1')
+        if transformation_batch < 0:
+            raise ValueError('`transformation_batch` must bigger than -1')
+        if transformation_workers < 0:
+            raise ValueError('`transformation_workers` must bigger than -1')
+        if debug_sample < 1:
+            raise ValueError('`debug_sample` must bigger than 0')
+        if debug_rate < 0:
+            raise ValueError('`debug_rate` must bigger than -1')
+        if debug_summary < 0:
+            raise ValueError('`debug_summary` must bigger than -1')
+        if post_batch < 0:
+            raise ValueError('`post_batch` must bigger than -1')
+        if post_interval < 0:
+            raise ValueError('`post_interval` must bigger than -1')
+        if transformation_time < 0:
+            raise ValueError('`transformation_time` must bigger than -1')
+        if not len(self._targets):
+            raise Exception(
+                'targets are empty, please add a target using `source.add()` first.'
+            )
+        if debug:
+            log = helper.Sampled_Log(sample = debug_sample, rate = debug_rate)
+        else:
+            log = None
+
+        if any(option['spool'] is not None for option in self._options):
+            raise ValueError('spool only supported by `start`')
+
+        loop = asyncio.get_event_loop()
+        tasks = []
+        self._pipes = []
+        for target, option in zip(self._targets, self._options):
+            if isinstance(target, str):
+                p = await asyncio.create_subprocess_exec(
+                    *target.split(),
+                    stdout = PIPE,
+                    stdin = PIPE,
+                    stderr = PIPE,
+                    limit = _stream_limit,
+                )
+                tasks.append(
+                    asyncio.ensure_future(
+                        function.alog_subprocess_output(
+                            p.stderr, graceful_shutdown, parse_error
+                        )
+                    )
+                )
+            else:
+                p = target
+
+            pipe = helper.Target(
+                p,
+                target,
+                pipeline = self.pipeline,
+                streams = option['streams'],
+            )
+            self._pipes.append(pipe)
+            if isinstance(p, asyncio.subprocess.Process):
+                tasks.append(
+                    asyncio.ensure_future(helper.check_pipe(pipe, log))
+                )
+
+        idle = self._idle(
+            transformation,
+            transformation_batch,
+            transformation_workers,
+            transformation_time,
+        )
+        # a single subprocess tap stays on asyncio streams, idle flush waits on `readline` with a timeout.
+        fan_in = len(self._taps) > 1 or (
+            idle and not isinstance(self.tap, str)
+        )
+        if fan_in:
+            pse = self._fan_in(
+                graceful_shutdown, parse_error, timeout = idle or None
+            )
+        elif isinstance(self.tap, str):
+            pse = await asyncio.create_subprocess_exec(
+                *self.tap.split(),
+                stdout = PIPE,
+                stdin = PIPE,
+                stderr = PIPE,
+                limit = _stream_limit,
+            )
+            tasks.append(
+                asyncio.ensure_future(
+                    function.alog_subprocess_output(
+                        pse.stderr, graceful_shutdown, parse_error
+                    )
+                )
+            )
+        else:
+            self.tap.reset()
+
+        if debug_summary > 0:
+            check_summary = helper.Check_Summary(
+                self._metrics, self._pipes, debug_summary, log
+            )
+            check_summary.start()
+        else:
+            check_summary = None
+
+        if post_function is not None and (post_batch > 0 or post_interval > 0):
+            post_batch = helper.Post_Batch(
+                post_function,
+                self.tap_name,
+                self._pipes,
+                post_batch,
+                post_interval,
+            )
+            post_batch.start()
+        else:
+            post_batch = None
+
+        builder = self._builder(transformation)
+        routes = {}
+        self._states = dict(tap_state or {})
+        self._rows = {}
+        self._pending = []
+        self._futures = deque()
+        if transformation and transformation_workers > 0:
+            executor = ProcessPoolExecutor(max_workers = transformation_workers)
+            self._max_futures = transformation_workers * 2
+        else:
+            executor = None
+
+        # blocking tap reads run in the pipeline's own thread, a tap sleeping inside `emit` must not take threads from the loop's default executor shared by other pipelines.
+        tap_executor = ThreadPoolExecutor(max_workers = 1)
+
+        try:
+            while True:
+                before = time.perf_counter()
+                tap = self.tap
+                if fan_in:
+                    lines = await loop.run_in_executor(
+                        tap_executor, next, pse, None
+                    )
+                    final = lines is None
+                    if not final:
+                        tap, lines = lines
+                elif isinstance(self.tap, str):
+                    try:
+                        lines = await asyncio.wait_for(
+                            pse.stdout.readline(), idle or None
+                        )
+                        final = not len(lines)
+                    except asyncio.TimeoutError:
+                        lines, final = [], False
+                else:
+                    lines = await loop.run_in_executor(
+                        tap_executor, next, self.tap
+                    )
+                    final = lines is None
+                self._metrics.observe('tap', time.perf_counter() - before)
+                if final:
+                    lines = []
+                if isinstance(lines, bytes):
+                    lines = [lines]
+                lines = self._state(lines, tap)
+                self._read(lines, tap)
+                before = time.perf_counter()
+                flush = final or not len(lines)
+                lines, rows = self._transform(
+                    lines,
+                    transformation,
+                    builder,
+                    transformation_batch,
+                    transformation_dataframe,
+                    executor = executor,
+                    flush = flush,
+                    age = transformation_time,
+                    block = False,
+                )
+                while executor is not None and self._blocked(flush):
+                    await asyncio.wrap_future(self._futures[0][0])
+                    collected, collected_rows = self._collect(
+                        builder, block = False
+                    )
+                    lines.extend(collected)
+                    self._merge(rows, collected_rows)
+                if transformation:
+                    self._metrics.observe(
+                        'transformation', time.perf_counter() - before
+                    )
+                for line in lines:
+                    line, message_type, stream, size = self._prepare(
+                        line, log, ignore_null
+                    )
+                    if line is not None:
+                        _, routed_pipes = self._route(
+                            routes, stream, [], self._pipes
+                        )
+                        if message_type != 'RECORD':
+                            stream = None
+                        results = await asyncio.gather(
+                            *[
+                                _asinking(line, pipe, size, stream)
+                                for pipe in routed_pipes
+                            ]
+                        )
+                        if log is not None:
+                            for pipe, result in zip(routed_pipes, results):
+                                if result is not None:
+                                    log.log(pipe.name, result)
+
+                        self._ack(post_function, post_batch, size, stream)
+
+                self._deliver(rows)
+
+                if final:
+                    break
+
+            if executor is not None:
+                executor.shutdown()
+
+            tap_executor.shutdown()
+
+            if check_summary is not None:
+                check_summary.stopped.set()
+
+            if post_batch is not None:
+                post_batch.close()
+
+            for pipe in self._pipes:
+                if isinstance(pipe.target, asyncio.subprocess.Process):
+                    pipe.target.stdin.close()
+                    await pipe.target.wait()
+
+            if not fan_in and isinstance(self.tap, str):
+                await pse.wait()
+
+            await asyncio.gather(*tasks)
+
         except Exception as e:
             if graceful_shutdown > 0:
                 logger.error(e)
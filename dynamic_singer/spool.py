@@ -0,0 +1,214 @@
+import os
+import mmap
+import struct
+import threading
+
+_header = struct.Struct('<I')
+
+# length written at the end of a segment, reader continues from the next segment.
+_end = 0xFFFFFFFF
+
+
+def _segment_name(segment):
+    return '{:020d}.spool'.format(segment)
+
+
+class Spool:
+    def __init__(
+        self,
+        path: str,
+        max_size: int = 1073741824,
+        segment_size: int = 67108864,
+    ):
+        """
+        Append-only log on local disk, split into memory-mapped segments. Records are length-prefixed bytes, a segment is deleted after all of its records acknowledged.
+
+        Parameters
+        ----------
+        path: str
+            directory to store segments, acknowledged offset and SCHEMA lines.
+        max_size: int, (default=1073741824)
+            maximum bytes of segments on disk, `put` will block if reached.
+        segment_size: int, (default=67108864)
+            size of a segment in bytes.
+        """
+        if max_size < 1:
+            raise ValueError('`max_size` must bigger than 0')
+        if segment_size < 1:
+            raise ValueError('`segment_size` must bigger than 0')
+        os.makedirs(path, exist_ok = True)
+        self.path = path
+        self.segment_size = min(segment_size, max_size)
+        self.max_segments = max(max_size // self.segment_size, 2)
+        self._maps = {}
+        self._condition = threading.Condition()
+
+        segments = self._segments()
+        self.schemas = []
+        self._ack = self._read_offset()
+        if self._ack is None:
+            self._ack = (segments[0] if len(segments) else 0, 0)
+        for segment in segments:
+            if segment < self._ack[0]:
+                self._delete(segment)
+
+        self._read = self._ack
+        self._segment, self._position = self._scan(
+            max(segments + [self._ack[0]])
+        )
+
+    def _segments(self):
+        return sorted(
+            int(f.split('.')[0])
+            for f in os.listdir(self.path)
+            if f.endswith('.spool')
+        )
+
+    def _read_offset(self):
+        try:
+            with open(os.path.join(self.path, 'offset')) as fopen:
+                lines = fopen.read().split('\n')
+            segment, position = lines[0].split()
+            self.schemas = [line for line in lines[1:] if len(line)]
+            return int(segment), int(position)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _map(self, segment):
+        if segment not in self._maps:
+            filename = os.path.join(self.path, _segment_name(segment))
+            with open(filename, 'ab+') as fopen:
+                if os.fstat(fopen.fileno()).st_size < self.segment_size:
+                    fopen.truncate(self.segment_size)
+                self._maps[segment] = mmap.mmap(
+                    fopen.fileno(), self.segment_size
+                )
+        return self._maps[segment]
+
+    def _delete(self, segment):
+        m = self._maps.pop(segment, None)
+        if m is not None:
+            m.close()
+        try:
+            os.remove(os.path.join(self.path, _segment_name(segment)))
+        except FileNotFoundError:
+            pass
+
+    def _scan(self, segment):
+        m = self._map(segment)
+        position = 0
+        while position + _header.size <= self.segment_size:
+            (size,) = _header.unpack_from(m, position)
+            if size == 0:
+                break
+            if size == _end:
+                return segment + 1, 0
+            position += _header.size + size
+        return segment, position
+
+    def put(self, data: bytes, timeout: float = None):
+        """
+        Append a record, block while spool reached `max_size`.
+
+        Returns
+        -------
+        result: bool
+            False if timeout.
+        """
+        size = len(data)
+        if size + _header.size * 2 > self.segment_size:
+            raise ValueError(
+                f'record size {size} is bigger than spool segment size {self.segment_size}'
+            )
+        with self._condition:
+            if self._position + _header.size * 2 + size > self.segment_size:
+                if not self._condition.wait_for(
+                    lambda: self._segment + 1 - self._ack[0]
+                    < self.max_segments,
+                    timeout,
+                ):
+                    return False
+                self._roll()
+            m = self._map(self._segment)
+            start = self._position + _header.size
+            m[start : start + size] = data
+            _header.pack_into(m, self._position, size)
+            self._position = start + size
+            self._condition.notify_all()
+        return True
+
+    def _roll(self):
+        m = self._map(self._segment)
+        if self._position + _header.size <= self.segment_size:
+            _header.pack_into(m, self._position, _end)
+        self._segment += 1
+        self._position = 0
+        self._map(self._segment)
+
+    def get(self, timeout: float = None):
+        """
+        Read next record after the last read record.
+
+        Returns
+        -------
+        result: (bytes, offset) / None
+            None if timeout, pass `offset` to `ack` after the record is delivered.
+        """
+        with self._condition:
+            if not self._condition.wait_for(self._available, timeout):
+                return None
+            segment, position = self._read
+            m = self._map(segment)
+            (size,) = _header.unpack_from(m, position)
+            start = position + _header.size
+            data = m[start : start + size]
+            self._read = (segment, start + size)
+            return data, self._read
+
+    def _available(self):
+        segment, position = self._read
+        while segment < self._segment:
+            if position + _header.size <= self.segment_size:
+                (size,) = _header.unpack_from(self._map(segment), position)
+                if size != _end and size != 0:
+                    break
+            segment, position = segment + 1, 0
+        self._read = (segment, position)
+        return self._read != (self._segment, self._position)
+
+    def ack(self, offset, schemas = None):
+        """
+        Persist acknowledged offset, delete segments before the offset.
+
+        Parameters
+        ----------
+        offset: (int, int)
+            offset returned by `get`.
+        schemas: list, (default=None)
+            latest SCHEMA line of each stream before the offset, available as `schemas` after a restart.
+        """
+        segment, position = offset
+        if schemas is not None:
+            self.schemas = list(schemas)
+        filename = os.path.join(self.path, 'offset')
+        with open(filename + '.tmp', 'w') as fopen:
+            fopen.write(
+                '\n'.join([f'{segment} {position}'] + self.schemas) + '\n'
+            )
+        os.replace(filename + '.tmp', filename)
+        with self._condition:
+            previous = self._ack[0]
+            self._ack = offset
+            for s in range(previous, segment):
+                self._delete(s)
+            self._condition.notify_all()
+
+    def close(self):
+        """
+        Flush and unmap all segments.
+        """
+        with self._condition:
+            for m in self._maps.values():
+                m.flush()
+                m.close()
+            self._maps = {}
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dynamic_singer import metrics
+from herpetologist import check_type
+
+logger = logging.getLogger()
+
+
+class Supervisor:
+    @check_type
+    def __init__(self, port: int = 8000, max_workers: int = None):
+        """
+        Run multiple `Source` pipelines concurrently in a single process, sharing a single prometheus exporter labelled by `pipeline` and `target`.
+
+        Parameters
+        ----------
+        port: int, (default=8000)
+            prometheus exporter port. If 0, will not start the exporter.
+        max_workers: int, (default=None)
+            maximum pipelines running at the same time for `start`. If None, will run all pipelines at the same time.
+        """
+        metrics.start_server(port)
+        self.max_workers = max_workers
+        self._pipelines = []
+
+    def add(self, source, **kwargs):
+        """
+        Parameters
+        ----------
+        source: dynamic_singer.Source
+            pipeline to run, initiate it with `port = 0` to use the exporter from supervisor.
+        **kwargs:
+            keyword arguments for `source.start` or `source.astart`. Set `graceful_shutdown = 0` to raise the error instead of exiting the whole process.
+        """
+        if not hasattr(source, 'start') or not hasattr(source, 'astart'):
+            raise ValueError('source must a `dynamic_singer.Source`')
+        self._pipelines.append((source, kwargs))
+
+    def get_pipelines(self):
+        """
+        Returns
+        ----------
+        result: list of (source, kwargs)
+        """
+        return self._pipelines
+
+    def start(self):
+        """
+        Run all pipelines using `source.start` in a thread pool, block until all pipelines stopped.
+        """
+        if not len(self._pipelines):
+            raise Exception(
+                'pipelines are empty, please add a pipeline using `supervisor.add()` first.'
+            )
+        max_workers = self.max_workers or len(self._pipelines)
+        with ThreadPoolExecutor(max_workers = max_workers) as executor:
+            futures = [
+                executor.submit(source.start, **kwargs)
+                for source, kwargs in self._pipelines
+            ]
+            errors = []
+            for future, (source, _) in zip(futures, self._pipelines):
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f'pipeline {source.pipeline} stopped: {e}')
+                    errors.append(e)
+        if len(errors):
+            raise errors[0]
+
+    async def astart(self):
+        """
+        Run all pipelines using `source.astart` in the current event loop, block until all pipelines stopped.
+        """
+        if not len(self._pipelines):
+            raise Exception(
+                'pipelines are empty, please add a pipeline using `supervisor.add()` first.'
+            )
+        results = await asyncio.gather(
+            *[source.astart(**kwargs) for source, kwargs in self._pipelines],
+            return_exceptions = True,
+        )
+        errors = []
+        for result, (source, _) in zip(results, self._pipelines):
+            if isinstance(result, Exception):
+                logger.error(f'pipeline {source.pipeline} stopped: {result}')
+                errors.append(result)
+        if len(errors):
+            raise errors[0]
@@ -17,8 +17,8 @@ setuptools.setup(
         'singer-python==5.3.3',
         'jsonschema',
         'herpetologist',
-        'tornado',
     ],
+    extras_require = {'fast': ['orjson']},
     license = 'MIT',
     classifiers = [
         'Programming Language :: Python :: 3.7',
@@ -16,6 +16,11 @@ import time
 from jsonschema import validate
 import singer
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 from oauth2client import tools
 from tempfile import TemporaryFile
 
@@ -218,7 +223,10 @@ def persist_lines_job(
                 validate(msg.record, schema)
 
             # NEWLINE_DELIMITED_JSON expects literal JSON formatted data, with a newline character splitting each row.
-            dat = bytes(json.dumps(msg.record) + '\n', 'UTF-8')
+            if orjson is not None:
+                dat = orjson.dumps(msg.record) + b'\n'
+            else:
+                dat = bytes(json.dumps(msg.record) + '\n', 'UTF-8')
 
             rows[msg.stream].write(dat)
             count += 1